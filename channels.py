@@ -0,0 +1,65 @@
+from typing import Optional
+
+import discord
+
+
+class ChannelResolver:
+    def __init__(self, client: discord.Client, configs):
+        self.client = client
+        # Anything whose get(guild_id) has output_channel_id and
+        # output_channel_name
+        self.configs = configs
+        self.hits = 0
+        self.misses = 0
+        # guild_id -> channel_id, pinned after the first lookup by name
+        self._resolved = {}
+
+    def resolve(self, guild_id: int) -> Optional[discord.abc.GuildChannel]:
+        config = self.configs.get(guild_id)
+        channel_id = config.output_channel_id or self._resolved.get(guild_id)
+        if channel_id is not None:
+            channel = self.client.get_channel(channel_id)
+            if channel is not None:
+                self.hits += 1
+                return channel
+            self._resolved.pop(guild_id, None)
+
+        self.misses += 1
+        guild = self.client.get_guild(guild_id)
+        if guild is None or config.output_channel_name is None:
+            return None
+        channel = discord.utils.get(
+            guild.channels, name=config.output_channel_name
+        )
+        if channel is not None:
+            self._resolved[guild_id] = channel.id
+        return channel
+
+    def invalidate(self, guild_id: Optional[int] = None):
+        if guild_id is None:
+            self._resolved.clear()
+        else:
+            self._resolved.pop(guild_id, None)
+
+    def on_channel_create(self, channel: discord.abc.GuildChannel):
+        config = self.configs.get(channel.guild.id)
+        if channel.name == config.output_channel_name:
+            self.invalidate(channel.guild.id)
+
+    def on_channel_delete(self, channel: discord.abc.GuildChannel):
+        if self._resolved.get(channel.guild.id) == channel.id:
+            self.invalidate(channel.guild.id)
+
+    def on_channel_update(
+        self,
+        before: discord.abc.GuildChannel,
+        after: discord.abc.GuildChannel,
+    ):
+        if before.name == after.name:
+            return
+        config = self.configs.get(after.guild.id)
+        if (
+            self._resolved.get(after.guild.id) == after.id
+            or after.name == config.output_channel_name
+        ):
+            self.invalidate(after.guild.id)
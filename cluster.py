@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger("discord")
+
+# A worker only acts on a shard while it holds that shard's lease in the
+# shared database, and renews it well before it runs out
+LEASE_TTL = 30
+RENEW_INTERVAL = LEASE_TTL / 3
+# Workers that die sooner than this after starting are restarted with a delay
+RESTART_DELAY = 5
+
+
+def shard_for(guild_id, shard_count):
+    # The same mapping Discord uses to route a guild's events
+    return (guild_id >> 22) % shard_count
+
+
+class Cluster:
+    # mode is None for a single connection, "auto" for every shard in this
+    # process, or "workers" for this process's slice of the shards
+    def __init__(
+        self, mode=None, shard_count=None, worker_index=0, worker_count=1
+    ):
+        self.mode = mode
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.shard_count = shard_count
+        self.shard_ids = None
+        if mode == "workers":
+            self.shard_count = shard_count or worker_count
+            self.shard_ids = [
+                shard_id
+                for shard_id in range(self.shard_count)
+                if shard_id % worker_count == worker_index
+            ]
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+        self._held = set()
+        self._held_until = 0.0
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        mode = os.getenv("SHARD_MODE") or None
+        if mode not in (None, "auto", "workers"):
+            raise ValueError(f"Unknown SHARD_MODE {mode!r}")
+        shard_count = os.getenv("SHARD_COUNT")
+        return cls(
+            mode,
+            int(shard_count) if shard_count else None,
+            int(os.getenv("WORKER_INDEX", 0)),
+            int(os.getenv("WORKER_COUNT", 1)),
+        )
+
+    @property
+    def sharded(self):
+        return self.mode is not None
+
+    @property
+    def partitioned(self):
+        return self.mode == "workers"
+
+    @property
+    def primary(self):
+        # Runs the jobs that must happen once per application
+        return self.worker_index == 0
+
+    def bot_options(self):
+        options = {}
+        if self.shard_count:
+            options["shard_count"] = self.shard_count
+        if self.shard_ids is not None:
+            options["shard_ids"] = self.shard_ids
+        return options
+
+    def shard_filter(self):
+        # For queries that only want rows this worker owns
+        if not self.partitioned:
+            return None
+        return self.shard_count, self.shard_ids
+
+    def lease_filter(self):
+        # Like shard_filter, but only the shards whose leases are held right
+        # now; called per query so a lost or lapsed lease stops the work
+        if not self.partitioned:
+            return None
+        if time.time() >= self._held_until:
+            return self.shard_count, []
+        return self.shard_count, sorted(self._held)
+
+    def local_path(self, path):
+        if not self.partitioned:
+            return path
+        return f"{path}.worker{self.worker_index}"
+
+    def _shard(self, guild_id):
+        # DMs arrive on shard 0
+        return 0 if guild_id is None else shard_for(guild_id, self.shard_count)
+
+    def owns(self, guild_id):
+        return not self.partitioned or self._shard(guild_id) in self.shard_ids
+
+    def holds(self, guild_id):
+        if not self.partitioned:
+            return True
+        return (
+            self._shard(guild_id) in self._held
+            and time.time() < self._held_until
+        )
+
+    async def acquire(self, repo):
+        if not self.partitioned:
+            return
+        started = time.time()
+        held = await repo.claim_shards(
+            self.owner, self.shard_ids, started, started + LEASE_TTL
+        )
+        missing = set(self.shard_ids) - set(held)
+        if missing:
+            logger.warning(
+                f"Shards {sorted(missing)} are leased by another worker"
+            )
+        self._held = set(held)
+        self._held_until = started + LEASE_TTL
+
+    def start(self, repo):
+        if self.partitioned and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._renew(repo))
+
+    async def _renew(self, repo):
+        while True:
+            try:
+                await self.acquire(repo)
+            except Exception:
+                logger.exception("Failed to renew shard leases")
+            await asyncio.sleep(RENEW_INTERVAL)
+
+    async def stop(self, repo):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._held:
+            self._held = set()
+            await repo.release_shards(self.owner)
+
+
+def main():
+    # Runs WORKER_COUNT copies of the app, each owning a slice of the
+    # shards and serving HTTP on PORT + its index
+    logging.basicConfig(level=logging.INFO)
+    worker_count = int(os.getenv("WORKER_COUNT", os.cpu_count() or 1))
+    base_port = int(os.getenv("PORT", 8080))
+    script = os.getenv("WORKER_SCRIPT", "wsgi.py")
+
+    def spawn(index):
+        env = dict(
+            os.environ,
+            SHARD_MODE="workers",
+            WORKER_INDEX=str(index),
+            WORKER_COUNT=str(worker_count),
+            PORT=str(base_port + index),
+        )
+        logger.info(f"Starting worker {index} on port {base_port + index}")
+        return subprocess.Popen([sys.executable, script], env=env)
+
+    workers = {index: spawn(index) for index in range(worker_count)}
+    started = {index: time.monotonic() for index in workers}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        time.sleep(1)
+        for index, process in list(workers.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping:
+                del workers[index]
+                continue
+            logger.warning(f"Worker {index} exited with {code}, restarting")
+            if time.monotonic() - started[index] < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            workers[index] = spawn(index)
+            started[index] = time.monotonic()
+
+
+if __name__ == "__main__":
+    main()
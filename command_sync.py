@@ -0,0 +1,62 @@
+import hashlib
+import json
+import logging
+import os
+
+from discord import app_commands
+
+logger = logging.getLogger("discord")
+
+COMMAND_HASH_PATH = os.getenv("COMMAND_HASH_PATH", ".command_tree.json")
+
+
+def _check_names(command):
+    return [
+        f"{check.__module__}.{check.__qualname__}"
+        for check in getattr(command, "checks", [])
+    ]
+
+
+def fingerprint(tree: app_commands.CommandTree, guild=None) -> str:
+    payload = []
+    for command in sorted(tree.get_commands(guild=guild), key=lambda c: c.name):
+        data = command.to_dict()
+        data["checks"] = _check_names(command)
+        payload.append(data)
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _load_hashes(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_hashes(path, hashes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(hashes, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+async def sync_if_changed(
+    tree: app_commands.CommandTree, guild=None, path=COMMAND_HASH_PATH
+) -> bool:
+    if guild is not None:
+        # Guild commands propagate instantly, unlike global ones
+        tree.copy_global_to(guild=guild)
+    scope = f"{tree.client.application_id}:{guild.id if guild else 'global'}"
+    current = fingerprint(tree, guild)
+    hashes = _load_hashes(path)
+    if hashes.get(scope) == current:
+        logger.info(f"Command tree unchanged for {scope}, skipping sync")
+        return False
+
+    await tree.sync(guild=guild)
+    hashes[scope] = current
+    _save_hashes(path, hashes)
+    logger.info(f"Synced command tree for {scope}")
+    return True
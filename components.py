@@ -0,0 +1,92 @@
+import logging
+
+import discord
+
+logger = logging.getLogger("discord")
+
+# Discord's cap on a component's custom_id
+CUSTOM_ID_LIMIT = 100
+
+
+class ComponentRouter:
+    # Routes persistent component interactions by a templated custom_id,
+    # "<prefix>:<action>:<target>", so nothing is kept per message. Targets
+    # too long to fit are left out and resolved from the message instead.
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.handlers = {}
+        self.aliases = {}
+        self.dispatched = 0
+        self.unrouted = 0
+
+    def route(self, action, *legacy_ids):
+        # Handlers are awaited with (interaction, target); target is None
+        # when the custom_id carried none. Legacy custom_ids from before the
+        # router map onto the action without a target.
+        def decorator(func):
+            self.handlers[action] = func
+            for custom_id in legacy_ids:
+                self.aliases[custom_id] = action
+            return func
+
+        return decorator
+
+    def custom_id(self, action, target=None) -> str:
+        custom_id = f"{self.prefix}:{action}"
+        if target is not None and self.fits(action, target):
+            return f"{custom_id}:{target}"
+        return custom_id
+
+    def fits(self, action, target) -> bool:
+        return (
+            len(self.prefix) + len(action) + len(target) + 2 <= CUSTOM_ID_LIMIT
+        )
+
+    def parse(self, custom_id):
+        action = self.aliases.get(custom_id)
+        if action is not None:
+            return action, None
+        prefix, _, rest = custom_id.partition(":")
+        if prefix != self.prefix:
+            return None
+        action, _, target = rest.partition(":")
+        return action, target or None
+
+    def button(self, action, target=None, **kwargs) -> discord.ui.Button:
+        return discord.ui.Button(
+            custom_id=self.custom_id(action, target), **kwargs
+        )
+
+    def view(self, *items) -> discord.ui.View:
+        # Only used for its layout: stopped up front so discord.py does not
+        # keep it around or dispatch to it
+        view = discord.ui.View(timeout=None)
+        for item in items:
+            view.add_item(item)
+        view.stop()
+        return view
+
+    def owns(self, interaction: discord.Interaction) -> bool:
+        # Whether the press is for one of this router's components
+        return self._parse_interaction(interaction) is not None
+
+    def _parse_interaction(self, interaction):
+        if interaction.type is not discord.InteractionType.component:
+            return None
+        custom_id = (interaction.data or {}).get("custom_id")
+        return self.parse(custom_id) if custom_id else None
+
+    async def dispatch(self, interaction: discord.Interaction) -> bool:
+        parsed = self._parse_interaction(interaction)
+        if not parsed:
+            return False
+        action, target = parsed
+        custom_id = interaction.data["custom_id"]
+        handler = self.handlers.get(action)
+        if handler is None:
+            self.unrouted += 1
+            logger.warning(f"No handler for component {custom_id!r}")
+            return False
+        self.dispatched += 1
+        await handler(interaction, target)
+        return True
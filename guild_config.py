@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+GuildConfig = namedtuple(
+    "GuildConfig",
+    [
+        "guild_id",
+        "output_channel_id",
+        "output_channel_name",
+        "timeout_seconds",
+        "required_role_id",
+    ],
+)
+SETTINGS = GuildConfig._fields[1:]
+
+
+class GuildConfigCache:
+    # Every guild is served; a settings row only overrides the defaults the
+    # process was started with
+    def __init__(self, repo, **defaults):
+        self.repo = repo
+        self.defaults = dict.fromkeys(SETTINGS)
+        self.defaults.update(defaults)
+        self._overrides = {}
+        self._resolved = {}
+
+    def configure_defaults(self, **defaults):
+        self.defaults.update(defaults)
+        self._resolved.clear()
+
+    async def load(self):
+        overrides = {}
+        for row in await self.repo.load_guild_settings():
+            overrides[row.pop("guild_id")] = row
+        self._overrides = overrides
+        self._resolved.clear()
+
+    def get(self, guild_id) -> GuildConfig:
+        config = self._resolved.get(guild_id)
+        if config is None:
+            overrides = self._overrides.get(guild_id, {})
+            config = self._resolved[guild_id] = GuildConfig(
+                guild_id,
+                *(
+                    (
+                        self.defaults[name]
+                        if overrides.get(name) is None
+                        else overrides[name]
+                    )
+                    for name in SETTINGS
+                ),
+            )
+        return config
+
+    def __contains__(self, guild_id):
+        return guild_id in self._overrides
+
+    async def update(self, guild_id, **fields) -> GuildConfig:
+        unknown = set(fields) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown guild settings: {', '.join(unknown)}")
+        await self.repo.save_guild_settings(guild_id, **fields)
+        self._overrides.setdefault(guild_id, {}).update(fields)
+        self._resolved.pop(guild_id, None)
+        return self.get(guild_id)
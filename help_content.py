@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import re
+
+from pagination import chunk, embed_pages
+
+logger = logging.getLogger("discord")
+
+HELP_PATH = "cmds.md"
+HELP_TITLE = "Bot Commands"
+RELOAD_INTERVAL = 30
+
+_HEADING = re.compile(r"^(#+ .*|\*\*[^*\n]+\*\*:?)$")
+
+
+def sections(text):
+    # Blank lines separate sections; a heading is kept with the section
+    # that follows it so it never ends a page on its own
+    result = []
+    heading = None
+    for block in re.split(r"\n\s*\n", text.strip()):
+        block = block.strip()
+        if not block:
+            continue
+        if _HEADING.match(block):
+            heading = block if heading is None else f"{heading}\n\n{block}"
+            continue
+        if heading is not None:
+            block = f"{heading}\n\n{block}"
+            heading = None
+        result.append(block)
+    if heading is not None:
+        result.append(heading)
+    return result
+
+
+class HelpContent:
+    # Parsed once into embeds; interactions only ever read self.pages, and
+    # the file is re-read off the event loop when its mtime changes
+    def __init__(self, path=HELP_PATH):
+        self.path = path
+        self.pages = []
+        self.mtime = None
+        self._task = None
+
+    def parse(self, text):
+        title = HELP_TITLE
+        match = re.search(r"^# (.+)$", text, re.MULTILINE)
+        if match:
+            title = match.group(1).strip()
+            text = text[match.end() :]
+        return embed_pages(title, chunk(sections(text), separator="\n\n"))
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self.mtime is not None or self.pages:
+                logger.warning(f"{self.path} is missing, help is unavailable")
+            self.pages, self.mtime = [], None
+            return False
+        if mtime == self.mtime:
+            return False
+        with open(self.path, "r") as f:
+            pages = self.parse(f.read())
+        self.pages, self.mtime = pages, mtime
+        logger.info(f"Loaded {len(pages)} help pages from {self.path}")
+        return True
+
+    def start(self, interval=RELOAD_INTERVAL):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch(interval))
+
+    async def _watch(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.reload_if_changed)
+            except Exception:
+                logger.exception(f"Failed to reload {self.path}")
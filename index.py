@@ -4,36 +4,187 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
+import json
 import os
-from flask import Flask
+import signal
 from dotenv import load_dotenv
-from models import Session, Proposal, User
+from repository import ProposalRepository
+from registry import (
+    ProposalRecord,
+    ProposalRegistry,
+    guild_of,
+    normalise,
+    proposal_key,
+)
+from membership import MembershipCache
+from notifications import NotificationDispatcher
+from scheduler import DeadlineScheduler
+from messages import MessageEditor
+from channels import ChannelResolver
+from pagination import PageCache, Paginator, chunk, embed_pages
+from components import ComponentRouter
+from snapshot import SnapshotPublisher, etag_matches
+from help_content import HelpContent
+from guild_config import GuildConfigCache
+import metrics
+from command_sync import sync_if_changed
+from journal import JOURNAL_PATH, Journal, RecoveryState
+from cluster import Cluster
+from outbox import Outbox, action
+from transitions import TransitionCoordinator
 import logging
 from datetime import datetime
+from typing import Optional
 import time
-import atexit
 import calendar
-from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("discord")
 logger.setLevel(logging.DEBUG)
 
 
+# The HTTP routes, shared by the Flask app and the asyncio web app. They
+# only read state the bot publishes, so they never wait on the bot or the
+# database. Each returns (body, status, headers).
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def json_body(data):
+    return json.dumps(data).encode()
+
+
+def snapshot_response(body, etag, if_none_match):
+    # Pollers revalidate every time and get a 304 while nothing changed
+    headers = dict(JSON_HEADERS, ETag=f'"{etag}"')
+    headers["Cache-Control"] = "no-cache"
+    if etag_matches(if_none_match, etag):
+        return b"", 304, headers
+    return body, 200, headers
+
+
+def health_route():
+    return json_body({"status": "ok"}), 200, JSON_HEADERS
+
+
+def ready_route():
+    ready = bot.is_ready() and not bot.is_closed()
+    return json_body({"ready": ready}), 200 if ready else 503, JSON_HEADERS
+
+
+def metrics_route():
+    return (
+        metrics.registry.render().encode(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4"},
+    )
+
+
+def proposals_route(if_none_match=None):
+    snapshot = api_snapshot.current
+    return snapshot_response(snapshot.body, snapshot.etag, if_none_match)
+
+
+def proposal_route(proposal_id, if_none_match=None):
+    item = api_snapshot.current.item(normalise(proposal_id))
+    if item is None:
+        return json_body({"error": "not found"}), 404, JSON_HEADERS
+    return snapshot_response(*item, if_none_match)
+
+
 def create_app():
+    # Imported here so the asyncio runtime never loads Flask
+    from flask import Flask, request
+
     app = Flask(__name__)
+
+    # These run on waitress threads
+    @app.route("/healthz")
+    def healthz():
+        return health_route()
+
+    @app.route("/readyz")
+    def readyz():
+        return ready_route()
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return metrics_route()
+
+    @app.route("/api/proposals")
+    def api_proposals():
+        return proposals_route(request.headers.get("If-None-Match"))
+
+    @app.route("/api/proposals/<path:proposal_id>")
+    def api_proposal(proposal_id):
+        return proposal_route(proposal_id, request.headers.get("If-None-Match"))
+
+    return app
+
+
+def create_web_app():
+    # The same routes as create_app, served by aiohttp on the bot's loop
+    from aiohttp import web
+
+    def respond(result):
+        body, status, headers = result
+        return web.Response(body=body, status=status, headers=headers)
+
+    async def healthz(request):
+        return respond(health_route())
+
+    async def readyz(request):
+        return respond(ready_route())
+
+    async def metrics_endpoint(request):
+        return respond(metrics_route())
+
+    async def api_proposals(request):
+        return respond(proposals_route(request.headers.get("If-None-Match")))
+
+    async def api_proposal(request):
+        return respond(
+            proposal_route(
+                request.match_info["proposal_id"],
+                request.headers.get("If-None-Match"),
+            )
+        )
+
+    app = web.Application()
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_get("/api/proposals", api_proposals)
+    app.router.add_get("/api/proposals/{proposal_id:.+}", api_proposal)
     return app
 
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
+# The home guild: DMs are served to its members. Output channel and
+# timeout are defaults that each guild can override.
 SERVER_ID = 977606746317144154
 OUTPUT_CHANNEL_NAME = "fedex"
 TIMEOUT_SECONDS = 172800
+# How long a shutdown waits for due deadlines and outbound actions
+SHUTDOWN_GRACE = float(os.getenv("SHUTDOWN_GRACE", 10))
+# Member lookups in flight at once for a guild that isn't chunked
+MEMBER_LOOKUP_CONCURRENCY = 8
 
+# The members intent is privileged and has to be enabled for the
+# application in the developer portal
 intents = discord.Intents.default()
 intents.guilds = True
+intents.members = True
 intents.message_content = True
+# Chunked guilds answer membership from the cache instead of REST, at the
+# cost of a slower ready in large guilds
+CHUNK_GUILDS = os.getenv("CHUNK_GUILDS", "true").lower() in ("1", "true")
+
+membership = MembershipCache()
+cluster = Cluster.from_env()
 
 
 class CommandTree(app_commands.CommandTree):
@@ -42,310 +193,723 @@ class CommandTree(app_commands.CommandTree):
         self.bot = bot
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
-        guild = await self.bot.fetch_guild(SERVER_ID)
-        if guild is None:
-            return False
-        member = await guild.fetch_member(interaction.user.id)
-        return member is not None
+        if interaction.guild_id is None:
+            return SERVER_ID is not None and await membership.is_member(
+                self.bot, SERVER_ID, interaction.user.id
+            )
+        # Interactions from inside a guild carry the member already
+        if isinstance(interaction.user, discord.Member):
+            membership.set_member(interaction.guild_id, interaction.user.id)
+        return has_required_role(interaction.guild_id, interaction.user)
+
+
+def has_required_role(guild_id, user):
+    role_id = guild_configs.get(guild_id).required_role_id
+    if role_id is None:
+        return True
+    if not isinstance(user, discord.Member):
+        return False
+    # Admins keep access so they can't lock themselves out through /config
+    return (
+        user.get_role(role_id) is not None
+        or user.guild_permissions.manage_guild
+    )
 
 
-class Bot(commands.Bot):
+class Bot(commands.AutoShardedBot if cluster.sharded else commands.Bot):
     def __init__(self, **kwargs):
         super().__init__(
-            command_prefix="/", intents=intents, tree_cls=CommandTree, **kwargs
+            command_prefix="/",
+            intents=intents,
+            tree_cls=CommandTree,
+            chunk_guilds_at_startup=CHUNK_GUILDS,
+            **kwargs,
         )
+        self._shutting_down = False
+        self.hydrated = False
 
     async def setup_hook(self):
         self.tree.bot = self
-        await self.tree.sync()
+        global recovery
+        recovery = await self.loop.run_in_executor(None, journal.replay)
+        journal.start()
+        cluster.start(repo)
+        await guild_configs.load()
+        await self.loop.run_in_executor(None, help_content.reload_if_changed)
+        help_content.start()
+        # A pinned channel id only makes sense for the home guild, so it is
+        # stored as that guild's setting the first time round
+        output_channel_id = os.getenv("OUTPUT_CHANNEL_ID")
+        if output_channel_id and SERVER_ID and SERVER_ID not in guild_configs:
+            await guild_configs.update(
+                SERVER_ID, output_channel_id=int(output_channel_id)
+            )
+        metrics.instrument_http(self.http)
+        metrics.instrument_rate_limits()
+        self.loop.create_task(metrics.monitor_loop_lag())
+        scheduler.start()
+        guild = None
+        if SERVER_ID and os.getenv("SYNC_COMMANDS_TO_GUILD", "").lower() in (
+            "1",
+            "true",
+        ):
+            guild = discord.Object(id=SERVER_ID)
+        # Commands belong to the application, so one worker syncs them
+        if cluster.primary:
+            await sync_if_changed(self.tree, guild=guild)
+
+    async def close(self):
+        if not self._shutting_down:
+            self._shutting_down = True
+            # Deadlines that are already due still pass, and the outbox gets
+            # what is left of the grace period to deliver; the connection
+            # stays up until both are done
+            logger.info(f"Shutting down, draining for up to {SHUTDOWN_GRACE}s")
+            drain_until = time.monotonic() + SHUTDOWN_GRACE
+            await scheduler.stop(SHUTDOWN_GRACE)
+            await outbox.drain(max(0.0, drain_until - time.monotonic()))
+            await cluster.stop(repo)
+            await journal.close()
+        await super().close()
 
 
 load_dotenv()
-bot = Bot(owner_id=int(os.getenv("OWNER_ID")))
+repo = ProposalRepository()
+journal = Journal(cluster.local_path(JOURNAL_PATH))
+recovery = RecoveryState()
+bot = Bot(owner_id=int(os.getenv("OWNER_ID")), **cluster.bot_options())
+dispatcher = NotificationDispatcher(bot)
+outbox = Outbox(repo, shards=cluster.lease_filter)
+guild_configs = GuildConfigCache(
+    repo,
+    output_channel_name=OUTPUT_CHANNEL_NAME,
+    timeout_seconds=TIMEOUT_SECONDS,
+)
+output_channels = ChannelResolver(bot, guild_configs)
+
+
+async def pass_proposals(proposal_ids):
+    await asyncio.gather(
+        *(pass_proposal(proposal_id) for proposal_id in proposal_ids)
+    )
+
+
+scheduler = DeadlineScheduler(pass_proposals)
+transitions = TransitionCoordinator()
+
+
+def message_link(guild_id, channel_id, message_id):
+    return f"https://discord.com/channels/{guild_id}/{channel_id}/{message_id}"
+
+
+def build_api_snapshot():
+    # Runs on the bot thread; the HTTP API only ever reads the result
+    channels = {}
+    items = {}
+    for record in proposals.values():
+        link = None
+        if record.message_id is not None:
+            if record.guild_id not in channels:
+                channels[record.guild_id] = output_channels.resolve(
+                    record.guild_id
+                )
+            channel = channels[record.guild_id]
+            if channel is not None:
+                link = message_link(
+                    record.guild_id, channel.id, record.message_id
+                )
+        items[record.id] = {
+            "id": record.id,
+            "guild_id": str(record.guild_id),
+            "name": record.name,
+            "deadline": record.deadline,
+            "subscribers": len(record.subscribers),
+            "message_link": link,
+        }
+    return proposals.version, items
+
+
+api_snapshot = SnapshotPublisher(build_api_snapshot)
+proposals = ProposalRegistry(repo, journal, on_change=api_snapshot.changed)
+
+
+async def on_message_replaced(old_message_id, new_message):
+    proposal = proposals.by_message_id(old_message_id)
+    if proposal is not None:
+        await proposals.set_message_id(proposal.id, new_message.id)
+
+
+editor = MessageEditor(on_replaced=on_message_replaced)
+proposal_pages = PageCache()
+help_content = HelpContent()
+buttons = ComponentRouter("proposal")
+
+metrics.registry.callback(
+    "vite_active_proposals", "Proposals currently open", lambda: len(proposals)
+)
+metrics.registry.callback(
+    "vite_pending_timers",
+    "Deadlines waiting in the scheduler",
+    lambda: len(scheduler),
+)
+metrics.registry.callback(
+    "vite_transitions_total",
+    "Proposal transitions, by whether they ran, joined one under way or "
+    "waited for another",
+    lambda: {
+        "started": transitions.started,
+        "joined": transitions.joined,
+        "waited": transitions.waited,
+    },
+    type="counter",
+    label="result",
+)
+metrics.registry.callback(
+    "vite_transition_contention",
+    "Overlapping transition requests for the most contended proposals",
+    lambda: dict(transitions.hot()),
+    label="proposal",
+)
+metrics.registry.callback(
+    "vite_membership_cache_lookups_total",
+    "Membership gate lookups, by cache result",
+    lambda: {"hit": membership.hits, "miss": membership.misses},
+    type="counter",
+    label="result",
+)
+metrics.registry.callback(
+    "vite_message_edits_total",
+    "Proposal message edits, by outcome",
+    lambda: {
+        "sent": editor.edits,
+        "coalesced": editor.coalesced,
+        "replaced": editor.replaced,
+    },
+    type="counter",
+    label="outcome",
+)
+metrics.registry.callback(
+    "vite_page_cache_lookups_total",
+    "Rendered /view page lookups, by cache result",
+    lambda: {"hit": proposal_pages.hits, "miss": proposal_pages.misses},
+    type="counter",
+    label="result",
+)
+metrics.registry.callback(
+    "vite_component_interactions_total",
+    "Persistent button presses, by whether a handler took them",
+    lambda: {"routed": buttons.dispatched, "unrouted": buttons.unrouted},
+    type="counter",
+    label="result",
+)
+metrics.registry.callback(
+    "vite_outbox_pending",
+    "Outbound Discord actions waiting to be delivered",
+    lambda: outbox.pending,
+)
+metrics.registry.callback(
+    "vite_outbox_actions_total",
+    "Outbound Discord action attempts, by result",
+    lambda: {
+        "delivered": outbox.delivered,
+        "retried": outbox.retried,
+        "failed": outbox.failed,
+    },
+    type="counter",
+    label="result",
+)
 
-proposals = {}
-subscribed_users = set()
 server_start_time = time.time()
 
+OUTCOMES = {
+    "vetoed": "has been vetoed",
+    "passed": "has passed",
+    "deleted": "has been deleted by an admin",
+}
 
-def save_server_shutdown_time():
-    with open("server_shutdown_time.txt", "w") as f:
-        f.write(str(time.time()))
+MESSAGE_PRIORITY = 0
+DM_PRIORITY = 1
+PASS_RETRY_SECONDS = 30
 
 
-atexit.register(save_server_shutdown_time)
+def action_key(proposal_id, deadline, transition, target="message"):
+    # One key per side effect of a transition; the deadline tells apart
+    # proposals that reuse a name
+    return f"{proposal_id}:{deadline}:{transition}:{target}"
+
+
+def dm_actions(guild_id, proposal_id, deadline, transition, user_ids, content):
+    return [
+        action(
+            action_key(proposal_id, deadline, transition, f"dm:{user_id}"),
+            "dm",
+            DM_PRIORITY,
+            guild_id=guild_id,
+            user_id=user_id,
+            content=content,
+        )
+        for user_id in user_ids
+    ]
+
+
+def outcome_actions(proposal, event):
+    content = f"The proposal for {proposal.name} {OUTCOMES[event]}."
+    return [
+        action(
+            action_key(proposal.id, proposal.deadline, event),
+            "update",
+            MESSAGE_PRIORITY,
+            guild_id=proposal.guild_id,
+            message_id=proposal.message_id,
+            content=content,
+        )
+    ] + dm_actions(
+        proposal.guild_id,
+        proposal.id,
+        proposal.deadline,
+        event,
+        proposal.subscribers,
+        content,
+    )
 
 
 def get_server_downtime():
-    try:
-        with open("server_shutdown_time.txt", "r") as f:
-            shutdown_time = f.read()
-        return max(0, int(server_start_time - float(shutdown_time)))
-    except FileNotFoundError:
+    # The journal's last record before this start marks when we went down
+    if recovery.last_alive is None:
         return 0
+    return max(0, int(server_start_time - recovery.last_alive))
 
 
-def get_proposals():
-    session = Session()
-    proposals_db = session.query(Proposal).all()
+def get_extension_time(proposal):
+    half_window = (
+        proposal.deadline - calendar.timegm(proposal.created_at.timetuple())
+    ) // 2
+    if recovery.last_alive is None:
+        return half_window
+    # Give back the part of the veto window that elapsed while we were down,
+    # capped at half the original window; zero means it expired while we
+    # were up and simply missed its pass
+    lost = proposal.deadline - int(recovery.last_alive)
+    return max(0, min(half_window, lost))
+
+
+async def finish_transitions():
+    # Vetoes, passes and deletes that were journaled but never finalised
+    # The outcome's keys match the ones the interrupted delete would have
+    # written, so nothing is delivered twice. A row that is still there
+    # still has its subscribers, who are told before it goes.
+    pending, recovery.pending = recovery.pending, {}
+    if not pending:
+        return
+    rows = {row.id: row for row in await repo.load_proposals(list(pending))}
+    for proposal_id, record in pending.items():
+        row = rows.get(proposal_id)
+        proposal = ProposalRecord(
+            proposal_id,
+            guild_of(proposal_id) or SERVER_ID,
+            record["name"],
+            record.get("deadline"),
+            record.get("message_id"),
+            row.subscribers if row is not None else (),
+        )
+        await repo.delete_proposal(
+            proposal_id, outcome_actions(proposal, record["event"])
+        )
+        journal.append("finalised", proposal_id)
+        logger.info(f"Finished interrupted {record['event']} of {proposal_id}")
+
+
+async def get_proposals():
+    started = time.perf_counter()
+    await finish_transitions()
+    proposals_db = [
+        proposal
+        for proposal in await repo.load_proposals()
+        if cluster.owns(proposal.guild_id)
+    ]
     current_time = int(time.time())
     downtime = get_server_downtime()
+    extensions = {}
+    active = []
     for proposal in proposals_db:
         remaining_time = proposal.deadline - current_time
-        if remaining_time > 0:
-            proposals[proposal.id] = {
-                "name": proposal.name,
-                "subscribers": [
-                    subscriber.id for subscriber in proposal.subscribers
-                ],
-                "timer": asyncio.create_task(
-                    proposal_timer(proposal.id, proposal.name, remaining_time)
-                ),
-                "message_id": proposal.message_id,
-            }
+        extension_time = (
+            0 if remaining_time > 0 else get_extension_time(proposal)
+        )
+        if extension_time > 0:
+            extensions[proposal.id] = extension_time
         else:
-            asyncio.create_task(handle_expired_proposal(proposal, downtime))
-    session.close()
-    logger.info(f"Loaded {len(proposals)} active proposals from the database")
-    return proposals
+            # Past-due proposals with nothing to give back pass right away
+            active.append(proposal)
+            scheduler.schedule(proposal.id, proposal.deadline)
+    proposals.load(active)
+
+    # Expired proposals are extended together in a single transaction,
+    # along with the edits and DMs announcing it
+    if extensions:
+        deadlines = {
+            proposal_id: current_time + extension_time
+            for proposal_id, extension_time in extensions.items()
+        }
+        extended = await repo.extend_deadlines(
+            deadlines,
+            extension_actions(
+                [p for p in proposals_db if p.id in deadlines],
+                deadlines,
+                extensions,
+            ),
+        )
+        proposals.load(extended)
+        for proposal in extended:
+            scheduler.schedule(proposal.id, proposal.deadline)
+            journal.append("extended", proposal.id, deadline=proposal.deadline)
 
+    logger.info(
+        f"Loaded {len(proposals)} active proposals from the database, "
+        f"extended {len(extensions)} expired after {downtime}s downtime, "
+        f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+    )
 
-async def handle_expired_proposal(proposal, downtime):
-    extension_time = (
-        proposal.deadline - calendar.timegm(proposal.created_at.timetuple())
-    ) // 2
-    new_deadline = int(time.time()) + extension_time
 
-    session = Session()
-    try:
-        db_proposal = (
-            session.query(Proposal)
-            .options(joinedload(Proposal.subscribers))
-            .filter_by(id=proposal.id)
-            .first()
-        )
-        if db_proposal:
-            db_proposal.deadline = new_deadline
-            session.commit()
-
-            proposal_dict = {
-                "name": db_proposal.name,
-                "subscribers": [
-                    subscriber.id for subscriber in db_proposal.subscribers
-                ],
-                "message_id": db_proposal.message_id,
-            }
-
-            def get_ext_time_str(t):
-                if t < 60:
-                    return f"{extension_time} seconds"
-                elif t < 360:
-                    return f"{round(extension_time / 60, 2)} minutes"
-                else:
-                    return f"{round(extension_time / 360, 2)} hours"
-
-            ext_time_str = get_ext_time_str(extension_time)
-            await notify_subscribers(
-                proposal_dict,
-                f"extended by {ext_time_str} due to server downtime",
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds} seconds"
+    elif seconds < 3600:
+        return f"{round(seconds / 60, 2)} minutes"
+    else:
+        return f"{round(seconds / 3600, 2)} hours"
+
+
+def extension_actions(rows, deadlines, extensions):
+    actions = []
+    updates = {}
+    for row in rows:
+        deadline = deadlines[row.id]
+        if row.message_id:
+            actions.append(
+                action(
+                    action_key(row.id, deadline, "extended"),
+                    "update",
+                    MESSAGE_PRIORITY,
+                    guild_id=row.guild_id,
+                    message_id=row.message_id,
+                    content=f"The proposal for {row.name} has been extended to <t:{deadline}:R> due to server downtime.",
+                    proposal_id=row.id,
+                )
+            )
+        for user_id in row.subscribers:
+            updates.setdefault(user_id, [row.guild_id]).append(
+                f"The proposal for {row.name} has been extended by {format_duration(extensions[row.id])} due to server downtime."
             )
 
-            global proposals
-            proposals[db_proposal.id] = {
-                "name": db_proposal.name,
-                "subscribers": [
-                    subscriber.id for subscriber in db_proposal.subscribers
-                ],
-                "timer": asyncio.create_task(
-                    proposal_timer(
-                        db_proposal.id, db_proposal.name, extension_time
-                    )
-                ),
-                "message_id": db_proposal.message_id,
-            }
-
-            output_channel = await get_output_channel()
-            if output_channel and db_proposal.message_id:
-                try:
-                    message = await output_channel.fetch_message(
-                        db_proposal.message_id
-                    )
-                    view = ProposalView(db_proposal.id)
-                    await message.edit(
-                        content=f"The proposal for {db_proposal.name} has been extended to <t:{new_deadline}:R> due to server downtime.",
-                        view=view,
-                    )
-                    bot.add_view(view)
-                except discord.NotFound:
-                    view = ProposalView(db_proposal.id)
-                    new_message = await output_channel.send(
-                        f"The proposal for {db_proposal.name} has been extended to <t:{new_deadline}:f> due to server downtime.",
-                        view=view,
-                    )
-                    bot.add_view(view)
-                    proposals[db_proposal.id]["message_id"] = new_message.id
-                    db_proposal.message_id = new_message.id
-                    session.commit()
-    finally:
-        session.close()
+    # One DM per subscriber, however many of their proposals were extended
+    for user_id, (guild_id, *lines) in updates.items():
+        actions.append(
+            action(
+                f"recovery:{int(server_start_time)}:dm:{user_id}",
+                "dm",
+                DM_PRIORITY,
+                guild_id=guild_id,
+                user_id=user_id,
+                content="\n".join(lines),
+            )
+        )
+    return actions
+
+
+async def require_output_channel(guild_id):
+    channel = await get_output_channel(guild_id)
+    if channel is None:
+        # Retried: the channel cache may simply not be ready yet
+        raise RuntimeError(f"Couldn't find the output channel for {guild_id}")
+    return channel
+
+
+async def members_of(guild_id, user_ids):
+    guild = bot.get_guild(guild_id)
+    if guild is not None and guild.chunked:
+        # Every member is cached, so no lookup can need REST
+        return [
+            user_id
+            for user_id in user_ids
+            if guild.get_member(user_id) is not None
+        ]
+    # Uncached members are fetched one REST call each, so only a few at a
+    # time go out
+    lookups = asyncio.Semaphore(MEMBER_LOOKUP_CONCURRENCY)
+
+    async def is_member(user_id):
+        async with lookups:
+            return await membership.is_member(bot, guild_id, user_id)
+
+    user_ids = list(user_ids)
+    results = await asyncio.gather(
+        *(is_member(user_id) for user_id in user_ids)
+    )
+    return [user_id for user_id, member in zip(user_ids, results) if member]
 
 
-def get_subscribed_users():
-    session = Session()
-    subscribed_users = set(
-        user.id
-        for user in session.query(User).filter_by(subscribed_to_all=True).all()
+@outbox.handler("announce")
+async def announce_proposal(proposal_id, deadline, guild_id=None):
+    proposal = proposals.get(proposal_id)
+    if proposal is None:
+        return
+    output_channel = await require_output_channel(proposal.guild_id)
+    # A retry after the post went out only has the DMs left to queue; their
+    # keys make queueing them again harmless
+    if proposal.message_id is None:
+        message = await output_channel.send(
+            f"A member proposal for {proposal.name} was added, set to pass <t:{proposal.deadline}:R>",
+            view=proposal_view(proposal_id),
+        )
+        await proposals.set_message_id(proposal_id, message.id)
+
+    # Subscriptions to new proposals are global, but only members of the
+    # proposal's guild hear about it
+    link = message_link(
+        proposal.guild_id, output_channel.id, proposal.message_id
     )
-    session.close()
-    logger.info(
-        f"Loaded {len(subscribed_users)} subscribed users from the database"
+    subscribed_users = await repo.load_subscribed_users()
+    await outbox.enqueue(
+        dm_actions(
+            proposal.guild_id,
+            proposal_id,
+            deadline,
+            "created",
+            await members_of(proposal.guild_id, subscribed_users),
+            f"A new proposal for {proposal.name} has been created. View it here: {link}",
+        )
     )
-    return subscribed_users
+
+
+@outbox.handler("update")
+async def update_proposal_message(
+    message_id, content, proposal_id=None, guild_id=None
+):
+    output_channel = await require_output_channel(guild_id or SERVER_ID)
+    if message_id is None:
+        await output_channel.send(content)
+        return
+    view = None
+    if proposal_id is not None:
+        view = proposal_view(proposal_id)
+    await editor.edit(output_channel, message_id, content=content, view=view)
+
+
+# The dispatcher's DM-open and send buckets already pace these
+@outbox.handler("dm", paced=True)
+async def send_dm(user_id, content, guild_id=None):
+    await dispatcher.send_one(user_id, content)
+
+
+@outbox.handler("components")
+async def refresh_components(message_id, proposal_id, guild_id=None):
+    # Rewrites the buttons of a message posted before the router
+    if proposal_id not in proposals:
+        return
+    output_channel = await require_output_channel(guild_id or SERVER_ID)
+    try:
+        await output_channel.get_partial_message(message_id).edit(
+            view=proposal_view(proposal_id)
+        )
+    except discord.NotFound:
+        pass
 
 
 @bot.event
 async def on_ready():
     logger.info(f"Logged in as {bot.user.name}")
-    global proposals, subscribed_users
-    proposals.update(get_proposals())
-    subscribed_users.update(get_subscribed_users())
-    for proposal_id in proposals:
-        bot.add_view(ProposalView(proposal_id))
+    # on_ready fires again after every full reconnect; recovery is only for
+    # the downtime before this process started
+    if not bot.hydrated:
+        bot.hydrated = True
+        try:
+            await get_proposals()
+        except Exception:
+            bot.hydrated = False
+            raise
+    outbox.start()
+
+
+@bot.listen("on_interaction")
+async def route_components(interaction: discord.Interaction):
+    # Component presses never reach CommandTree.interaction_check, so the
+    # required role is enforced here too
+    if not buttons.owns(interaction):
+        return
+    if not has_required_role(interaction.guild_id, interaction.user):
+        await interaction.response.send_message(
+            "You don't have the role needed to use this bot.", ephemeral=True
+        )
+        return
+    await buttons.dispatch(interaction)
 
 
-async def get_output_channel():
-    guild = bot.get_guild(SERVER_ID)
-    if guild:
-        return discord.utils.get(guild.channels, name=OUTPUT_CHANNEL_NAME)
-    return None
+@bot.event
+async def on_member_join(member: discord.Member):
+    membership.set_member(member.guild.id, member.id)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    membership.set_member(after.guild.id, after.id)
+
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    membership.set_non_member(payload.guild_id, payload.user.id)
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    membership.clear(guild.id)
+
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    output_channels.on_channel_create(channel)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    output_channels.on_channel_delete(channel)
+
+
+@bot.event
+async def on_guild_channel_update(
+    before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+):
+    output_channels.on_channel_update(before, after)
+
+
+async def get_output_channel(guild_id):
+    return output_channels.resolve(guild_id)
 
 
 def is_guild_member():
     async def predicate(interaction: discord.Interaction):
-        guild = bot.get_guild(SERVER_ID)
-        if guild is None:
-            return False
-        member = guild.get_member(interaction.user.id)
-        return member is not None
+        guild_id = interaction.guild_id or SERVER_ID
+        return await membership.is_member(
+            bot, guild_id, interaction.user.id
+        ) and has_required_role(guild_id, interaction.user)
 
     return app_commands.check(predicate)
 
 
-class VetoView(discord.ui.View):
-    def __init__(self, proposal_id):
-        super().__init__(timeout=None)
-        self.proposal_id = proposal_id
-
-    @discord.ui.button(
-        label="Yes", style=discord.ButtonStyle.danger, custom_id="yes"
+def proposal_view(proposal_id):
+    return buttons.view(
+        buttons.button(
+            "veto",
+            proposal_id,
+            label="Veto",
+            style=discord.ButtonStyle.danger,
+        ),
+        buttons.button(
+            "subscribe",
+            proposal_id,
+            label="Subscribe",
+            style=discord.ButtonStyle.primary,
+        ),
     )
-    async def yes_button(
-        self, interaction: discord.Interaction, button: discord.ui.Button
-    ):
-        await veto_proposal(interaction, self.proposal_id)
+
+
+def pressed_proposal(interaction: discord.Interaction, target):
+    # Messages from before the router carry no id, and neither do ids too
+    # long for a custom_id; "#<message_id>" points at the proposal message
+    if target is None:
+        if interaction.message is None:
+            return None
+        return proposals.by_message_id(interaction.message.id)
+    if target.startswith("#"):
+        return proposals.by_message_id(int(target[1:]))
+    return proposals.get(target)
+
+
+@buttons.route("veto", "veto")
+@metrics.instrument("veto_button")
+async def veto_button(interaction: discord.Interaction, proposal_id):
+    proposal = pressed_proposal(interaction, proposal_id)
+    if not proposal:
         await interaction.response.send_message(
-            "You have vetoed the proposal.", ephemeral=True
+            "This proposal no longer exists.", ephemeral=True
         )
+        return
+    if proposal_id is None:
+        proposal_id = f"#{interaction.message.id}"
+    await confirm_veto(interaction, proposal, proposal_id)
+
 
-    @discord.ui.button(
-        label="No", style=discord.ButtonStyle.secondary, custom_id="no"
+async def confirm_veto(interaction: discord.Interaction, proposal, target):
+    # target is what the Yes button finds the proposal by again
+    await interaction.response.send_message(
+        f"Are you sure you want to veto the proposal for {proposal.name}?",
+        view=buttons.view(
+            buttons.button(
+                "confirm_veto",
+                target,
+                label="Yes",
+                style=discord.ButtonStyle.danger,
+            ),
+            buttons.button(
+                "cancel_veto", label="No", style=discord.ButtonStyle.secondary
+            ),
+        ),
+        ephemeral=True,
     )
-    async def no_button(
-        self, interaction: discord.Interaction, button: discord.ui.Button
-    ):
+
+
+@buttons.route("confirm_veto")
+@metrics.instrument("veto_confirm")
+async def confirm_veto_button(interaction: discord.Interaction, proposal_id):
+    proposal = pressed_proposal(interaction, proposal_id)
+    if proposal is None:
         await interaction.response.send_message(
-            "Veto cancelled.", ephemeral=True
+            "This proposal no longer exists.", ephemeral=True
+        )
+        return
+    if await veto_proposal(interaction, proposal.id):
+        await interaction.response.send_message(
+            "You have vetoed the proposal.", ephemeral=True
         )
 
 
-class ProposalView(discord.ui.View):
-    def __init__(self, proposal_id):
-        super().__init__(timeout=None)
-        self.proposal_id = proposal_id
+@buttons.route("cancel_veto")
+async def cancel_veto_button(interaction: discord.Interaction, proposal_id):
+    await interaction.response.send_message("Veto cancelled.", ephemeral=True)
 
-    @discord.ui.button(
-        label="Veto", style=discord.ButtonStyle.danger, custom_id="veto"
-    )
-    async def veto_button(
-        self, interaction: discord.Interaction, button: discord.ui.Button
-    ):
-        global proposals
-        proposal = proposals.get(self.proposal_id.lower())
-        if not proposal:
-            await interaction.response.send_message(
-                "This proposal no longer exists.", ephemeral=True
-            )
-            return
+
+@buttons.route("subscribe", "subscribe")
+@metrics.instrument("subscribe_button")
+async def subscribe_button(interaction: discord.Interaction, proposal_id):
+    proposal = pressed_proposal(interaction, proposal_id)
+    if not proposal:
+        await interaction.response.send_message(
+            "This proposal no longer exists.", ephemeral=True
+        )
+        return
+    if await proposals.subscribe(proposal.id, interaction.user.id):
         await interaction.response.send_message(
-            f"Are you sure you want to veto the proposal for {proposal['name']}?",
-            view=VetoView(self.proposal_id),
+            "You have subscribed to updates for this proposal.",
             ephemeral=True,
         )
-
-    @discord.ui.button(
-        label="Subscribe",
-        style=discord.ButtonStyle.primary,
-        custom_id="subscribe",
-    )
-    async def subscribe_button(
-        self, interaction: discord.Interaction, button: discord.ui.Button
-    ):
-        global proposals
-        proposal = proposals.get(self.proposal_id.lower())
-        if not proposal:
-            await interaction.response.send_message(
-                "This proposal no longer exists.", ephemeral=True
-            )
-            return
-        if interaction.user.id not in proposal["subscribers"]:
-            session = Session()
-            db_proposal = (
-                session.query(Proposal)
-                .filter_by(id=self.proposal_id.lower())
-                .first()
-            )
-            user = session.query(User).filter_by(id=interaction.user.id).first()
-            if not user:
-                user = User(id=interaction.user.id)
-                session.add(user)
-            if db_proposal:
-                db_proposal.subscribers.append(user)
-                session.commit()
-            session.close()
-
-            proposal["subscribers"].append(interaction.user.id)
-            await interaction.response.send_message(
-                "You have subscribed to updates for this proposal.",
-                ephemeral=True,
-            )
-        else:
-            await interaction.response.send_message(
-                "You are already subscribed to this proposal.", ephemeral=True
-            )
+    else:
+        await interaction.response.send_message(
+            "You are already subscribed to this proposal.", ephemeral=True
+        )
 
 
 @bot.tree.command(
     name="sub", description="Subscribe to new proposal notifications"
 )
+@metrics.instrument("sub")
 async def sub(interaction: discord.Interaction):
-
-    if interaction.user.id in subscribed_users:
+    # The database decides, since other workers may have changed it
+    if not await repo.set_global_subscription(interaction.user.id, True):
         await interaction.response.send_message(
             "You are already subscribed to new proposal notifications.",
             ephemeral=True,
         )
     else:
-        session = Session()
-        user = session.query(User).filter_by(id=interaction.user.id).first()
-        if user:
-            user.subscribed_to_all = True
-        else:
-            new_user = User(id=interaction.user.id, subscribed_to_all=True)
-            session.add(new_user)
-        session.commit()
-        session.close()
-
-        subscribed_users.add(interaction.user.id)
         await interaction.response.send_message(
             "You have subscribed to new proposal notifications.", ephemeral=True
         )
@@ -354,21 +918,14 @@ async def sub(interaction: discord.Interaction):
 @bot.tree.command(
     name="unsub", description="Unsubscribe from new proposal notifications"
 )
+@metrics.instrument("unsub")
 async def unsub(interaction: discord.Interaction):
-    if interaction.user.id not in subscribed_users:
+    if not await repo.set_global_subscription(interaction.user.id, False):
         await interaction.response.send_message(
             "You are not currently subscribed to new proposal notifications.",
             ephemeral=True,
         )
     else:
-        session = Session()
-        user = session.query(User).filter_by(id=interaction.user.id).first()
-        if user:
-            user.subscribed_to_all = False
-            session.commit()
-        session.close()
-
-        subscribed_users.discard(interaction.user.id)
         await interaction.response.send_message(
             "You have unsubscribed from new proposal notifications.",
             ephemeral=True,
@@ -376,10 +933,12 @@ async def unsub(interaction: discord.Interaction):
 
 
 @bot.tree.command(name="new", description="Propose a new member")
+@app_commands.guild_only()
 @app_commands.describe(name="Name of the proposed member")
+@metrics.instrument("new")
 async def new(interaction: discord.Interaction, name: str):
-    proposal_id = name.lower()
-    global proposals
+    guild_id = interaction.guild_id
+    proposal_id = proposal_key(guild_id, name)
 
     # Check if proposal already exists in memory
     if proposal_id in proposals:
@@ -388,147 +947,72 @@ async def new(interaction: discord.Interaction, name: str):
         )
         return
 
-    deadline = int(time.time()) + TIMEOUT_SECONDS
+    deadline = int(time.time()) + guild_configs.get(guild_id).timeout_seconds
+    output_channel = await get_output_channel(guild_id)
+    actions = []
+    if output_channel:
+        # Posted by the outbox once the row is committed, with retries
+        actions.append(
+            action(
+                action_key(proposal_id, deadline, "created"),
+                "announce",
+                MESSAGE_PRIORITY,
+                guild_id=guild_id,
+                proposal_id=proposal_id,
+                deadline=deadline,
+            )
+        )
 
-    session = Session()
     try:
-        # Check if proposal already exists in database
-        existing_proposal = (
-            session.query(Proposal).filter_by(id=proposal_id).first()
+        # The primary key rejects a proposal that already exists in the
+        # database, including one created concurrently
+        await proposals.create(
+            guild_id, name, deadline, datetime.utcnow(), actions
         )
-        if existing_proposal:
-            await interaction.response.send_message(
-                f"A proposal for '{name}' already exists.", ephemeral=True
-            )
-            return
-
-        new_proposal = Proposal(
-            id=proposal_id,
-            name=name,
-            deadline=deadline,
-            created_at=datetime.utcnow(),
+    except IntegrityError:
+        await interaction.response.send_message(
+            f"A proposal for '{name}' already exists.", ephemeral=True
         )
-        session.add(new_proposal)
-        session.commit()
-
-        remaining_time = TIMEOUT_SECONDS
-
-        proposals[proposal_id] = {
-            "name": name,
-            "subscribers": [],
-            "timer": asyncio.create_task(
-                proposal_timer(proposal_id, name, remaining_time)
-            ),
-        }
+        return
 
-        response_message = f"A member proposal for {name} was added, set to pass <t:{deadline}:R>"
+    scheduler.schedule(proposal_id, deadline)
+    outbox.wake()
 
+    if output_channel:
         await interaction.response.send_message(
             "Proposal created successfully.", ephemeral=True
         )
+    else:
+        await interaction.response.send_message(
+            "Proposal created, but couldn't find the output channel to announce it.",
+            ephemeral=True,
+        )
 
-        output_channel = await get_output_channel()
-        if output_channel:
-            view = ProposalView(proposal_id)
-            proposal_message = await output_channel.send(
-                response_message, view=view
-            )
-            bot.add_view(view)
-            proposals[proposal_id]["message_id"] = proposal_message.id
-
-            db_proposal = (
-                session.query(Proposal).filter_by(id=proposal_id).first()
-            )
-            if db_proposal:
-                db_proposal.message_id = proposal_message.id
-                session.commit()
-
-            for user_id in subscribed_users:
-                user = await bot.fetch_user(user_id)
-                if user:
-                    message_link = f"https://discord.com/channels/{SERVER_ID}/{output_channel.id}/{proposal_message.id}"
-                    await user.send(
-                        f"A new proposal for {name} has been created. View it here: {message_link}"
-                    )
-        else:
-            await interaction.followup.send(
-                f"Warning: Couldn't find the '{OUTPUT_CHANNEL_NAME}' channel to announce the proposal.",
-                ephemeral=True,
-            )
-    except Exception as e:
-        logger.error(f"Error creating new proposal: {str(e)}")
-        if proposal_id in proposals and "timer" in proposals[proposal_id]:
-            proposals[proposal_id]["timer"].cancel()
-
-        proposals.pop(proposal_id, None)
-
-        try:
-            db_proposal = (
-                session.query(Proposal).filter_by(id=proposal_id).first()
-            )
-            if db_proposal:
-                session.delete(db_proposal)
-                session.commit()
-        except Exception as db_error:
-            logger.error(
-                f"Error deleting proposal from database: {str(db_error)}"
-            )
 
-        await interaction.followup.send(
-            "An error occurred while creating the proposal. The proposal has been cancelled.",
-            ephemeral=True,
+async def finalise(proposal_id, event) -> Optional[ProposalRecord]:
+    # Ends a proposal once, however many callers ask at the same moment:
+    # they all get the one result, and the side effects happen once
+    async def transition():
+        proposal = await proposals.remove(
+            proposal_id, event=event, actions=outcome_actions
         )
-    finally:
-        session.close()
+        if proposal:
+            scheduler.cancel(proposal.id)
+            outbox.wake()
+            journal.append("finalised", proposal.id)
+        return proposal
+
+    return await transitions.run(normalise(proposal_id), event, transition)
 
 
 async def veto_proposal(interaction: discord.Interaction, proposal_id: str):
-    global proposals
-    proposal = proposals.get(proposal_id.lower())
+    proposal = await finalise(proposal_id, "vetoed")
     if not proposal:
         await interaction.response.send_message(
             "This proposal no longer exists.", ephemeral=True
         )
-        return
-
-    proposal["timer"].cancel()
-    await notify_subscribers(proposal, "vetoed")
-
-    session = Session()
-    db_proposal = (
-        session.query(Proposal).filter_by(id=proposal_id.lower()).first()
-    )
-    if db_proposal:
-        session.delete(db_proposal)
-        session.commit()
-    session.close()
-
-    proposals.pop(proposal_id.lower(), None)
-
-    output_channel = await get_output_channel()
-    if output_channel:
-        if "message_id" in proposal:
-            try:
-                message = await output_channel.fetch_message(
-                    proposal["message_id"]
-                )
-                await message.edit(
-                    content=f"The proposal for {proposal['name']} has been vetoed.",
-                    view=None,
-                )
-            except discord.NotFound:
-                await output_channel.send(
-                    f"The proposal for {proposal['name']} has been vetoed."
-                )
-        else:
-            await output_channel.send(
-                f"The proposal for {proposal['name']} has been vetoed."
-            )
-    else:
-        await interaction.followup.send(
-            f"Error: Couldn't find the '{OUTPUT_CHANNEL_NAME}' channel.",
-            ephemeral=True,
-        )
+        return None
+    return proposal
 
 
 def is_owner():
@@ -538,168 +1022,230 @@ def is_owner():
     return app_commands.check(predicate)
 
 
+VIEW_PAGE_SIZE = 15
+
+
+def render_proposal_pages(guild_id):
+    # Deadlines are rendered by the client, so a page stays correct until
+    # the registry itself changes
+    lines = []
+    for proposal in sorted(
+        proposals.for_guild(guild_id), key=lambda p: (p.deadline, p.id)
+    ):
+        subscribers = len(proposal.subscribers)
+        lines.append(
+            f"**{discord.utils.escape_markdown(proposal.name)}** · passes "
+            f"<t:{proposal.deadline}:R> · {subscribers} "
+            f"subscriber{'' if subscribers == 1 else 's'}"
+        )
+    return embed_pages(
+        "Current proposals", chunk(lines, per_page=VIEW_PAGE_SIZE)
+    )
+
+
 @bot.tree.command(name="view", description="View all current proposals")
+@app_commands.guild_only()
+@metrics.instrument("view_proposals")
 async def view_proposals(interaction: discord.Interaction):
-    if not proposals:
+    guild_id = interaction.guild_id
+    pages = proposal_pages.get(
+        guild_id, proposals.version, lambda: render_proposal_pages(guild_id)
+    )
+    if not pages:
         await interaction.response.send_message(
             "There are no active proposals.", ephemeral=True
         )
         return
+    await Paginator.send(interaction, pages, ephemeral=True)
+
+
+async def proposal_names(interaction: discord.Interaction, current: str):
+    # Answered from the registry's sorted ids, never the database
+    if interaction.guild_id is None:
+        return []
+    return [
+        app_commands.Choice(name=proposal.name, value=proposal.name)
+        for proposal in proposals.search(interaction.guild_id, current)
+        if len(proposal.name) <= 100
+    ]
 
-    proposal_list = "\n".join(
-        [f"{proposal['name']}" for proposal_id, proposal in proposals.items()]
-    )
-    await interaction.response.send_message(
-        f"Current proposals:\n{proposal_list}", ephemeral=True
-    )
+
+@bot.tree.command(name="veto", description="Anonymously veto a proposal")
+@app_commands.guild_only()
+@app_commands.describe(name="Name of the proposed member")
+@app_commands.autocomplete(name=proposal_names)
+@metrics.instrument("veto")
+async def veto(interaction: discord.Interaction, name: str):
+    proposal = proposals.get(proposal_key(interaction.guild_id, name))
+    if not proposal:
+        await interaction.response.send_message(
+            f"No proposal found for '{name}'.", ephemeral=True
+        )
+        return
+    target = proposal.id
+    if not buttons.fits("confirm_veto", target) and proposal.message_id:
+        target = f"#{proposal.message_id}"
+    await confirm_veto(interaction, proposal, target)
 
 
 @bot.tree.command(
     name="delete", description="(Dev command) Delete a specific proposal"
 )
+@app_commands.guild_only()
 @is_owner()
 @app_commands.describe(name="Name of the member being proposed")
+@app_commands.autocomplete(name=proposal_names)
+@metrics.instrument("delete_proposal")
 async def delete_proposal(interaction: discord.Interaction, name: str):
-    proposal_id = name.lower()
-    if proposal_id not in proposals:
+    proposal = await finalise(
+        proposal_key(interaction.guild_id, name), "deleted"
+    )
+    if not proposal:
         await interaction.response.send_message(
             f"No proposal found for '{name}'.", ephemeral=True
         )
         return
 
-    proposal = proposals[proposal_id]
-    proposal["timer"].cancel()
-    await notify_subscribers(proposal, "deleted by admin")
-
-    session = Session()
-    db_proposal = session.query(Proposal).filter_by(id=proposal_id).first()
-    if db_proposal:
-        session.delete(db_proposal)
-        session.commit()
-    session.close()
+    await interaction.response.send_message(
+        f"Proposal for '{name}' has been deleted.", ephemeral=True
+    )
 
-    proposals.pop(proposal_id)
 
-    output_channel = await get_output_channel()
-    if output_channel and "message_id" in proposal:
-        try:
-            message = await output_channel.fetch_message(proposal["message_id"])
-            await message.edit(
-                content=f"The proposal for {proposal['name']} has been deleted by an admin.",
-                view=None,
-            )
-        except discord.NotFound:
-            await output_channel.send(
-                f"The proposal for {proposal['name']} has been deleted by an admin."
-            )
+@bot.tree.command(
+    name="config", description="Configure the bot for this server"
+)
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(
+    channel="Channel proposals are posted in",
+    timeout_hours="Hours before a proposal passes unless vetoed",
+    required_role="Role needed to use the bot, @everyone to allow anyone",
+)
+@metrics.instrument("config")
+async def config(
+    interaction: discord.Interaction,
+    channel: Optional[discord.TextChannel] = None,
+    timeout_hours: Optional[app_commands.Range[int, 1, 720]] = None,
+    required_role: Optional[discord.Role] = None,
+):
+    guild_id = interaction.guild_id
+    fields = {}
+    if channel is not None:
+        fields["output_channel_id"] = channel.id
+    if timeout_hours is not None:
+        fields["timeout_seconds"] = timeout_hours * 3600
+    if required_role is not None:
+        fields["required_role_id"] = (
+            None if required_role.is_default() else required_role.id
+        )
+    if fields:
+        settings = await guild_configs.update(guild_id, **fields)
+        output_channels.invalidate(guild_id)
+    else:
+        settings = guild_configs.get(guild_id)
 
+    output_channel = await get_output_channel(guild_id)
+    role = (
+        f"<@&{settings.required_role_id}>"
+        if settings.required_role_id
+        else "anyone"
+    )
     await interaction.response.send_message(
-        f"Proposal for '{name}' has been deleted.", ephemeral=True
+        f"Output channel: {output_channel.mention if output_channel else 'not found'}\n"
+        f"Timeout: {format_duration(settings.timeout_seconds)}\n"
+        f"Allowed: {role}",
+        ephemeral=True,
     )
 
 
 @bot.tree.command(
     name="help", description="Get information about available commands"
 )
+@metrics.instrument("help_command")
 async def help_command(interaction: discord.Interaction):
-    try:
-        with open("cmds.md", "r") as file:
-            content = file.read()
-
-        help_text = content.split("# Bot Commands", 1)[-1].strip()
-
-        # Discord 2000-word limit (iirc)
-        if len(help_text) > 2000:
-            chunks = [
-                help_text[i : i + 2000] for i in range(0, len(help_text), 2000)
-            ]
-            for chunk in chunks:
-                await interaction.followup.send(chunk)
-            await interaction.response.send_message(
-                "Help information sent in multiple messages due to length.",
-                ephemeral=True,
-            )
-        else:
-            await interaction.response.send_message(help_text, ephemeral=True)
-    except FileNotFoundError:
+    pages = help_content.pages
+    if not pages:
         await interaction.response.send_message(
-            "Error: cmds.md file not found.", ephemeral=True
+            f"Error: {help_content.path} file not found.", ephemeral=True
         )
-    except Exception as e:
-        await interaction.response.send_message(
-            f"An error occurred while reading the help information: {str(e)}",
-            ephemeral=True,
-        )
-
-
-async def notify_subscribers(proposal, status):
-    subscribers = (
-        proposal["subscribers"]
-        if isinstance(proposal, dict)
-        else [subscriber.id for subscriber in proposal.subscribers]
-    )
-    name = proposal["name"] if isinstance(proposal, dict) else proposal.name
-    for user_id in subscribers:
-        user = await bot.fetch_user(user_id)
-        if user:
-            await user.send(f"The proposal for {name} has been {status}.")
-
-
-async def proposal_timer(proposal_id, name, remaining_time):
-    await asyncio.sleep(remaining_time)
-    global proposals
-    proposal = proposals.get(proposal_id.lower())
-    if proposal:
-        await notify_subscribers(proposal, "passed")
-        output_channel = await get_output_channel()
-        if output_channel:
-            if "message_id" in proposal:
-                try:
-                    message = await output_channel.fetch_message(
-                        proposal["message_id"]
-                    )
-                    await message.edit(
-                        content=f"The proposal for {name} has passed.",
-                        view=None,
-                    )
-                except discord.NotFound:
-                    await output_channel.send(
-                        f"The proposal for {name} has passed."
-                    )
-            else:
-                await output_channel.send(
-                    f"The proposal for {name} has passed."
-                )
-
-        session = Session()
-        db_proposal = (
-            session.query(Proposal).filter_by(id=proposal_id.lower()).first()
-        )
-        if db_proposal:
-            session.delete(db_proposal)
-            session.commit()
-        session.close()
+        return
+    await Paginator.send(interaction, pages, ephemeral=True)
 
-        proposals.pop(proposal_id.lower(), None)
 
+async def pass_proposal(proposal_id):
+    proposal = proposals.get(proposal_id)
+    if proposal is not None and not cluster.holds(proposal.guild_id):
+        # Another worker may own the shard now; check again later
+        logger.warning(f"Not passing {proposal_id} without its shard lease")
+        scheduler.schedule(proposal_id, int(time.time()) + PASS_RETRY_SECONDS)
+        return
+    try:
+        await finalise(proposal_id, "passed")
+    except Exception:
+        logger.exception(f"Failed to pass {proposal_id}, retrying shortly")
+        scheduler.schedule(proposal_id, int(time.time()) + PASS_RETRY_SECONDS)
 
-def setup_bot():
-    import threading
 
+def configure():
     load_dotenv()
-    token = os.getenv("DISCORD_TOKEN")
-
     global OUTPUT_CHANNEL_NAME
-    OUTPUT_CHANNEL_NAME = os.getenv("OUTPUT_CHANNEL_NAME")
+    OUTPUT_CHANNEL_NAME = os.getenv("OUTPUT_CHANNEL_NAME", OUTPUT_CHANNEL_NAME)
     global SERVER_ID
-    SERVER_ID = int(os.getenv("SERVER_ID"))
+    server_id = os.getenv("SERVER_ID")
+    SERVER_ID = int(server_id) if server_id else None
     global TIMEOUT_SECONDS
-    TIMEOUT_SECONDS = int(os.getenv("TIMEOUT_SECONDS"))
+    TIMEOUT_SECONDS = int(os.getenv("TIMEOUT_SECONDS", TIMEOUT_SECONDS))
+    guild_configs.configure_defaults(
+        output_channel_name=OUTPUT_CHANNEL_NAME,
+        timeout_seconds=TIMEOUT_SECONDS,
+    )
+    return os.getenv("DISCORD_TOKEN")
+
+
+def setup_bot():
+    # The threaded runtime: the bot on its own thread next to a WSGI server
+    import threading
 
+    token = configure()
     bot_thread = threading.Thread(target=lambda: bot.run(token))
     bot_thread.start()
 
 
+async def serve(token, port):
+    # The asyncio runtime: bot and web server share one loop, and SIGTERM
+    # or SIGINT shut both down gracefully
+    from aiohttp import web
+
+    runner = web.AppRunner(create_web_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logger.info(f"Serving HTTP on port {port}")
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    try:
+        async with bot:
+            running = asyncio.create_task(bot.start(token))
+            stop_requested = asyncio.create_task(stopping.wait())
+            await asyncio.wait(
+                {running, stop_requested}, return_when=asyncio.FIRST_COMPLETED
+            )
+            stop_requested.cancel()
+            if stopping.is_set():
+                logger.info("Received a shutdown signal")
+            await bot.close()
+            await running
+    finally:
+        await runner.cleanup()
+
+
+def run_asyncio(port):
+    asyncio.run(serve(configure(), port))
+
+
 if __name__ == "__main__":
     app = create_app()
     setup_bot()
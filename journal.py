@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("discord")
+
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "proposals.journal")
+FLUSH_INTERVAL = 0.1
+HEARTBEAT_INTERVAL = 15
+CHECKPOINT_INTERVAL = 300
+# Once the journal grows past this size a checkpoint starts a fresh file
+ROTATE_BYTES = 1024 * 1024
+
+TERMINAL_EVENTS = ("vetoed", "passed", "deleted")
+
+
+class RecoveryState:
+    def __init__(self, offset=0, last_alive=None, pending=None):
+        self.offset = offset
+        # Timestamp of the last record written before the previous shutdown
+        self.last_alive = last_alive
+        # proposal_id -> terminal event record that never reached "finalised"
+        self.pending = pending or {}
+
+    def apply(self, record):
+        self.last_alive = max(self.last_alive or 0, record["ts"])
+        event = record["event"]
+        proposal_id = record.get("id")
+        if event in TERMINAL_EVENTS:
+            self.pending[proposal_id] = record
+        elif event in ("finalised", "restored", "created"):
+            self.pending.pop(proposal_id, None)
+
+    def to_dict(self):
+        return {
+            "offset": self.offset,
+            "last_alive": self.last_alive,
+            "pending": self.pending,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["offset"], data["last_alive"], data["pending"])
+
+
+class Journal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.checkpoint_path = f"{path}.checkpoint"
+        self.state = RecoveryState()
+        self._buffer = []
+        self._waiters = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="journal"
+        )
+        self._task = None
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return RecoveryState.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return RecoveryState()
+
+    def replay(self) -> RecoveryState:
+        # Replaying a record twice is harmless, so a checkpoint that points
+        # past a rotated file simply starts again from the top
+        state = self._load_checkpoint()
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if state.offset > size:
+            state.offset = 0
+
+        replayed = skipped = 0
+        started = time.perf_counter()
+        if size:
+            with open(self.path, "rb") as f:
+                f.seek(state.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # A torn final write from a crash; cut it off so new
+                        # records start on a clean line
+                        os.truncate(self.path, state.offset)
+                        break
+                    try:
+                        state.apply(json.loads(line))
+                    except (ValueError, TypeError, KeyError):
+                        # Complete but unreadable; the records after it
+                        # still count
+                        logger.warning(
+                            f"Skipping bad journal record at byte "
+                            f"{state.offset}: {line[:80]!r}"
+                        )
+                        skipped += 1
+                    else:
+                        replayed += 1
+                    state.offset += len(line)
+
+        self.state = state
+        recovered = RecoveryState(
+            state.offset, state.last_alive, dict(state.pending)
+        )
+        logger.info(
+            f"Replayed {replayed} journal records in "
+            f"{(time.perf_counter() - started) * 1000:.1f}ms, "
+            f"{skipped} skipped, {len(state.pending)} unfinished transitions"
+        )
+        return recovered
+
+    def append(self, event, proposal_id=None, **data):
+        record = {"ts": time.time(), "event": event, "id": proposal_id, **data}
+        self._buffer.append(record)
+
+    async def commit(self, event, proposal_id=None, **data):
+        # Waits until the record is on disk, sharing the fsync with every
+        # other record written in the same flush
+        future = asyncio.get_running_loop().create_future()
+        self.append(event, proposal_id, **data)
+        self._waiters.append(future)
+        await future
+
+    def _write(self, records):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            for record in records:
+                line = (json.dumps(record) + "\n").encode()
+                self._file.write(line)
+                self.state.apply(record)
+                self.state.offset += len(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        waiters, self._waiters = self._waiters, []
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, records)
+        except Exception as e:
+            logger.exception("Failed to write journal records")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _checkpoint(self):
+        with self._lock:
+            if self.state.offset > ROTATE_BYTES:
+                # The checkpoint holds everything the old records implied
+                self.state.offset = 0
+                self._write_checkpoint()
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.path, "wb")
+            else:
+                self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def checkpoint(self):
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._checkpoint)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        last_heartbeat = last_checkpoint = time.monotonic()
+        self.append("heartbeat")
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                self.append("heartbeat")
+                last_heartbeat = now
+            await self.flush()
+            if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                await self.checkpoint()
+                last_checkpoint = now
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.append("shutdown")
+        await self.checkpoint()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,440 @@
+"""Drives the real handlers in index.py against a local fake of Discord.
+
+    python loadtest.py --proposals 10000 --subscribers 50000 --burst 1000
+
+Nothing touches the network: channel sends, message edits and DMs go to
+an in-process fake that adds latency and 429s. Each scenario reports
+throughput, handler latency percentiles and event loop lag.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import discord
+
+GUILD_ID = 977606746317144154
+_ids = itertools.count(10**17)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _Response:
+    # Enough of an aiohttp response for discord.HTTPException
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+
+class FakeDiscord:
+    def __init__(self, latency, jitter, rate_limit, retry_after, raise_429):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # discord.py normally sleeps out a 429 and retries by itself; with
+        # raise_429 the handlers see the error instead
+        self.raise_429 = raise_429
+        self.calls = {}
+        self.rate_limited = 0
+        self.latencies = []
+
+    async def request(self, route):
+        started = time.perf_counter()
+        self.calls[route] = self.calls.get(route, 0) + 1
+        await asyncio.sleep(
+            max(0.0, random.gauss(self.latency, self.latency * self.jitter))
+        )
+        if random.random() < self.rate_limit:
+            self.rate_limited += 1
+            if self.raise_429:
+                error = discord.HTTPException(
+                    _Response(429, "Too Many Requests"),
+                    "You are being rate limited.",
+                )
+                error.retry_after = self.retry_after
+                raise error
+            await asyncio.sleep(self.retry_after)
+        self.latencies.append(time.perf_counter() - started)
+
+
+class FakeMessage:
+    def __init__(self, fake, channel, message_id):
+        self.fake = fake
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **fields):
+        await self.fake.request("edit_message")
+        return self
+
+
+class FakeChannel:
+    def __init__(self, fake, channel_id):
+        self.fake = fake
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+    async def send(self, content=None, **fields):
+        await self.fake.request("send_message")
+        return FakeMessage(self.fake, self, next(_ids))
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self.fake, self, message_id)
+
+
+class FakeInteractionResponse:
+    def __init__(self, fake):
+        self.fake = fake
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **fields):
+        if self._done:
+            raise discord.InteractionResponded(None)
+        self._done = True
+        await self.fake.request("interaction_response")
+
+    async def edit_message(self, **fields):
+        await self.send_message(**fields)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.roles = []
+        self.guild_permissions = discord.Permissions.none()
+
+    def get_role(self, role_id):
+        return None
+
+
+class FakeInteraction:
+    def __init__(self, fake, user_id, guild_id=GUILD_ID):
+        self.user = FakeUser(user_id)
+        self.guild_id = guild_id
+        self.response = FakeInteractionResponse(fake)
+        self.followup = FakeChannel(fake, 0)
+
+
+class LagMonitor:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def __enter__(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+class Bench:
+    def __init__(self, index, fake, concurrency):
+        self.index = index
+        self.fake = fake
+        self.concurrency = concurrency
+        self.results = []
+
+    async def measure(self, name, calls, concurrency=None):
+        # calls are coroutine factories; concurrency=0 fires them all at once
+        concurrency = self.concurrency if concurrency is None else concurrency
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency or len(calls) or 1)
+
+        async def run(call):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await call()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        with LagMonitor() as lag:
+            started = time.perf_counter()
+            await asyncio.gather(*(run(call) for call in calls))
+            elapsed = time.perf_counter() - started
+        self.report(name, len(calls), elapsed, latencies, lag.samples, errors)
+
+    def report(self, name, count, elapsed, latencies, lag, errors=0):
+        result = {
+            "scenario": name,
+            "count": count,
+            "seconds": round(elapsed, 3),
+            "per_second": round(count / elapsed, 1) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "lag_p99_ms": round(percentile(lag, 99) * 1000, 2),
+            "lag_max_ms": round(max(lag, default=0) * 1000, 2),
+            "errors": errors,
+        }
+        self.results.append(result)
+        print(
+            f"{name:<28} {count:>7} in {elapsed:7.2f}s "
+            f"{result['per_second'] or 0:>9.1f}/s  "
+            f"p50 {result['p50_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+            f"lag p99 {result['lag_p99_ms']:>7.2f}ms  "
+            f"max {result['lag_max_ms']:>7.2f}ms  errors {errors}",
+            flush=True,
+        )
+
+    def interaction(self, user_id):
+        return FakeInteraction(self.fake, user_id)
+
+
+async def run(args):
+    import index
+    from notifications import TokenBucket
+
+    # The handlers log every call at INFO
+    logging.getLogger("discord").setLevel(logging.WARNING)
+
+    fake = FakeDiscord(
+        args.latency,
+        args.jitter,
+        args.rate_limit,
+        args.retry_after,
+        args.raise_429,
+    )
+    channel = FakeChannel(fake, next(_ids))
+    dm_channel = FakeChannel(fake, next(_ids))
+
+    async def is_member(client, guild_id, user_id):
+        return True
+
+    async def open_dm(user_id):
+        await fake.request("create_dm")
+        return dm_channel
+
+    # Everyone is a member and every guild has the same output channel
+    index.output_channels.resolve = lambda guild_id: channel
+    index.membership.is_member = is_member
+    index.dispatcher._dm_channel = open_dm
+
+    index.journal.start()
+    index.scheduler.start()
+    bench = Bench(index, fake, args.concurrency)
+    names = [f"Candidate {i}" for i in range(args.proposals)]
+    users = [next(_ids) for _ in range(args.subscribers)]
+
+    await bench.measure(
+        "new",
+        [
+            (
+                lambda name=name: index.new.callback(
+                    bench.interaction(users[0]), name
+                )
+            )
+            for name in names
+        ],
+    )
+    ids = [index.proposal_key(GUILD_ID, name) for name in names]
+
+    await bench.measure(
+        "sub",
+        [
+            (
+                lambda user_id=user_id: index.sub.callback(
+                    bench.interaction(user_id)
+                )
+            )
+            for user_id in users
+        ],
+    )
+
+    async def press_subscribe(proposal_id, user_id):
+        await index.subscribe_button(bench.interaction(user_id), proposal_id)
+
+    await bench.measure(
+        "subscribe_button",
+        [
+            (
+                lambda user_id=user_id: press_subscribe(
+                    random.choice(ids), user_id
+                )
+            )
+            for user_id in users
+        ],
+    )
+    hot = ids[0]
+    await bench.measure(
+        "subscribe_button burst",
+        [
+            (lambda user_id=user_id: press_subscribe(hot, user_id))
+            for user_id in random.sample(users, min(args.burst, len(users)))
+        ],
+        concurrency=0,
+    )
+
+    # Keystrokes in /veto and /delete: each prefix of a random name
+    await bench.measure(
+        "autocomplete",
+        [
+            (
+                lambda prefix=name[:length]: index.proposal_names(
+                    bench.interaction(users[0]), prefix
+                )
+            )
+            for name in random.sample(names, min(args.burst, len(names)))
+            for length in range(len(name) + 1)
+        ],
+    )
+
+    vetoed = ids[: args.burst]
+    await bench.measure(
+        "veto_proposal burst",
+        [
+            (
+                lambda proposal_id=proposal_id: index.veto_proposal(
+                    bench.interaction(users[0]), proposal_id
+                )
+            )
+            for proposal_id in vetoed
+        ],
+        concurrency=0,
+    )
+
+    expiring = ids[args.burst : args.burst * 2]
+    with LagMonitor() as lag:
+        started = time.perf_counter()
+        await index.pass_proposals(expiring)
+        elapsed = time.perf_counter() - started
+    bench.report(
+        "pass_proposals batch", len(expiring), elapsed, [elapsed], lag.samples
+    )
+
+    # Hydration of everything still open into a cold registry
+    remaining = ids[args.burst * 2 :]
+    for proposal_id in list(index.proposals):
+        index.scheduler.cancel(proposal_id)
+        index.proposals.discard(proposal_id)
+    with LagMonitor() as lag:
+        started = time.perf_counter()
+        await index.get_proposals()
+        elapsed = time.perf_counter() - started
+    bench.report(
+        "get_proposals", len(remaining), elapsed, [elapsed], lag.samples
+    )
+
+    # Outbox drain of everything the scenarios above queued
+    # Runs with the bot's own limits unless told otherwise
+    if args.outbox_rate:
+        index.outbox.bucket = TokenBucket(args.outbox_rate, 1.0)
+    if args.send_rate:
+        index.dispatcher.send_bucket = TokenBucket(args.send_rate, 1.0)
+    if args.outbox_concurrency:
+        index.outbox.concurrency = args.outbox_concurrency
+    before = index.outbox.delivered
+    with LagMonitor() as lag:
+        started = time.perf_counter()
+        index.outbox.start()
+        deadline = started + args.drain_seconds
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.5)
+            pending, _ = await index.repo.action_backlog()
+            if not pending:
+                break
+        elapsed = time.perf_counter() - started
+        await index.outbox.stop()
+    delivered = index.outbox.delivered - before
+    bench.report(
+        "outbox drain", delivered, elapsed, fake.latencies, lag.samples
+    )
+
+    print(
+        f"fake REST calls: {json.dumps(fake.calls)}; "
+        f"429s injected: {fake.rate_limited}; "
+        f"outbox retried {index.outbox.retried}, failed {index.outbox.failed}, "
+        f"pending {pending}"
+    )
+    await index.scheduler.stop()
+    await index.journal.close()
+    index.repo.shutdown()
+    return bench.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--proposals", type=int, default=10000)
+    parser.add_argument("--subscribers", type=int, default=50000)
+    parser.add_argument("--burst", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="mean REST latency, s"
+    )
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument(
+        "--rate-limit", type=float, default=0.01, help="share of 429s"
+    )
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument(
+        "--raise-429",
+        action="store_true",
+        help="surface 429s to the handlers instead of retrying like discord.py",
+    )
+    parser.add_argument(
+        "--outbox-rate",
+        type=int,
+        help="override the outbox's shared action rate, per second",
+    )
+    parser.add_argument(
+        "--outbox-concurrency",
+        type=int,
+        help="override the outbox's concurrent deliveries",
+    )
+    parser.add_argument(
+        "--send-rate",
+        type=int,
+        help="override the bot's global DM send cap, per second",
+    )
+    parser.add_argument("--drain-seconds", type=float, default=60)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    if args.proposals < args.burst * 2:
+        parser.error("--proposals must be at least twice --burst")
+
+    workdir = tempfile.mkdtemp(prefix="vite-loadtest-")
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        JOURNAL_PATH=os.path.join(workdir, "bench.journal"),
+        OWNER_ID=os.getenv("OWNER_ID", "1"),
+        SERVER_ID=str(GUILD_ID),
+    )
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    print(f"Working files left in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
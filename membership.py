@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import time
+from typing import Optional
+
+import discord
+
+MEMBER_TTL_SECONDS = 900
+NON_MEMBER_TTL_SECONDS = 60
+# Entries kept before expired ones are swept out, and then the oldest
+MAX_ENTRIES = 100_000
+
+
+class MembershipCache:
+    def __init__(
+        self,
+        ttl=MEMBER_TTL_SECONDS,
+        negative_ttl=NON_MEMBER_TTL_SECONDS,
+        max_entries=MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (guild_id, user_id) -> (is_member, expires_at)
+        self._entries = {}
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[bool]:
+        entry = self._entries.get((guild_id, user_id))
+        if entry is None:
+            return None
+        is_member, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[(guild_id, user_id)]
+            return None
+        return is_member
+
+    def set_member(self, guild_id: int, user_id: int):
+        self._set((guild_id, user_id), True, self.ttl)
+
+    def set_non_member(self, guild_id: int, user_id: int):
+        self._set((guild_id, user_id), False, self.negative_ttl)
+
+    def _set(self, key, is_member, ttl):
+        now = time.monotonic()
+        # Re-inserted so the dict stays in write order, oldest first
+        self._entries.pop(key, None)
+        self._entries[key] = (is_member, now + ttl)
+        if len(self._entries) > self.max_entries:
+            self._sweep(now)
+
+    def _sweep(self, now):
+        self._entries = {
+            key: entry for key, entry in self._entries.items() if entry[1] > now
+        }
+        excess = len(self._entries) - self.max_entries * 3 // 4
+        if excess > 0:
+            for key in list(itertools.islice(self._entries, excess)):
+                del self._entries[key]
+
+    def invalidate(self, guild_id: int, user_id: int):
+        self._entries.pop((guild_id, user_id), None)
+
+    def clear(self, guild_id: Optional[int] = None):
+        if guild_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == guild_id]:
+            del self._entries[key]
+
+    async def is_member(
+        self, client: discord.Client, guild_id: int, user_id: int
+    ) -> bool:
+        cached = self.get(guild_id, user_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        # Concurrent misses for the same user share one lookup
+        key = (guild_id, user_id)
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._lookup(client, guild_id, user_id)
+            )
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(
+        self, client: discord.Client, guild_id: int, user_id: int
+    ) -> bool:
+        guild = client.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild else None
+        # A chunked guild's member list is complete, so a miss there is an
+        # answer; only unchunked guilds need asking over REST
+        if member is None and not (guild is not None and guild.chunked):
+            try:
+                if guild is None:
+                    guild = await client.fetch_guild(guild_id)
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                member = None
+
+        if member is None:
+            self.set_non_member(guild_id, user_id)
+            return False
+        self.set_member(guild_id, user_id)
+        return True
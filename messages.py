@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+import discord
+
+logger = logging.getLogger("discord")
+
+
+class _PendingEdit:
+    __slots__ = ("channel", "fields", "waiters")
+
+    def __init__(self, channel, fields):
+        self.channel = channel
+        self.fields = fields
+        self.waiters = []
+
+
+class MessageEditor:
+    def __init__(self, on_replaced=None):
+        # Awaited with (old_message_id, new_message) when an edit target was
+        # gone and a replacement had to be posted
+        self.on_replaced = on_replaced
+        self.edits = 0
+        self.coalesced = 0
+        self.replaced = 0
+        self._queued = {}
+        self._running = {}
+
+    async def edit(self, channel, message_id, **fields) -> int:
+        future = asyncio.get_running_loop().create_future()
+        pending = self._queued.get(message_id)
+        if pending is not None:
+            # Not sent yet, so the newer fields simply win
+            pending.fields.update(fields)
+            self.coalesced += 1
+        else:
+            pending = self._queued[message_id] = _PendingEdit(channel, fields)
+        pending.waiters.append(future)
+
+        if message_id not in self._running:
+            self._running[message_id] = asyncio.create_task(
+                self._drain(message_id)
+            )
+        return await future
+
+    async def _drain(self, message_id):
+        try:
+            while True:
+                pending = self._queued.pop(message_id, None)
+                if pending is None:
+                    return
+                try:
+                    result = await self._apply(
+                        pending.channel, message_id, pending.fields
+                    )
+                except Exception as e:
+                    for waiter in pending.waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                else:
+                    for waiter in pending.waiters:
+                        if not waiter.done():
+                            waiter.set_result(result)
+        finally:
+            self._running.pop(message_id, None)
+
+    async def _apply(self, channel, message_id, fields) -> int:
+        self.edits += 1
+        try:
+            # A partial message edits by id without fetching it first
+            await channel.get_partial_message(message_id).edit(**fields)
+            return message_id
+        except discord.NotFound:
+            logger.info(f"Message {message_id} is gone, posting a replacement")
+            self.replaced += 1
+            message = await channel.send(**fields)
+            if self.on_replaced is not None:
+                await self.on_replaced(message_id, message)
+            return message.id
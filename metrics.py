@@ -0,0 +1,302 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+
+import discord
+
+# Metrics are written from the bot's event loop and the database thread and
+# read from Flask's threads. Each metric guards its own values with a lock
+# that is only held to update or copy numbers, never across I/O.
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    # The escapes the exposition format allows in a label value
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        return []
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in values]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class CallbackMetric(Metric):
+    # Reads a value owned by another object at scrape time; the callback
+    # returns a number or a {label value: number} dict
+    def __init__(self, name, description, callback, type="gauge", label=None):
+        super().__init__(name, description)
+        self.type = type
+        self.callback = callback
+        self.label = label
+
+    def _samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [
+                f"{self.name}{_format_labels(((self.label, k),))} {v}"
+                for k, v in list(value.items())
+            ]
+        return [f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., count, sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            values = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, series in values:
+            for bound, count in zip(self.buckets, series):
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(key, (('le', bound),))} {count}"
+                )
+            lines.append(
+                f"{self.name}_bucket"
+                f"{_format_labels(key, (('le', '+Inf'),))} {series[-2]}"
+            )
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._add(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, description, buckets))
+
+    def callback(self, name, description, callback, type="gauge", label=None):
+        with self._lock:
+            metric = CallbackMetric(name, description, callback, type, label)
+            self._metrics[name] = metric
+            return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+interaction_latency = registry.histogram(
+    "vite_interaction_seconds", "Time spent handling an interaction"
+)
+interaction_errors = registry.counter(
+    "vite_interaction_errors_total", "Interactions whose handler raised"
+)
+loop_lag = registry.histogram(
+    "vite_event_loop_lag_seconds",
+    "How late the event loop woke up a periodic probe",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+db_commit = registry.histogram(
+    "vite_db_commit_seconds", "Time spent committing a database session"
+)
+dm_sends = registry.counter(
+    "vite_dm_sends_total", "Direct messages sent to subscribers, by result"
+)
+rest_requests = registry.histogram(
+    "vite_discord_rest_seconds", "Discord REST request latency, by route"
+)
+rest_errors = registry.counter(
+    "vite_discord_rest_errors_total", "Discord REST requests that failed"
+)
+rate_limits = registry.counter(
+    "vite_discord_rate_limited_total", "429 responses received from Discord"
+)
+
+
+def instrument(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                interaction_errors.inc(handler=name)
+                raise
+            finally:
+                interaction_latency.observe(
+                    time.perf_counter() - start, handler=name
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_http(http):
+    request = http.request
+
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except discord.HTTPException as e:
+            rest_errors.inc(
+                method=route.method, path=route.path, status=e.status
+            )
+            raise
+        finally:
+            rest_requests.observe(
+                time.perf_counter() - start,
+                method=route.method,
+                path=route.path,
+            )
+
+    http.request = timed_request
+
+
+class _RateLimitLogHandler(logging.Handler):
+    # discord.py retries 429s internally and only reports them in its logs
+    def emit(self, record):
+        message = record.msg if isinstance(record.msg, str) else ""
+        if "responded with 429" in message:
+            rate_limits.inc()
+
+
+def instrument_rate_limits():
+    logger = logging.getLogger("discord.http")
+    if not any(isinstance(h, _RateLimitLogHandler) for h in logger.handlers):
+        logger.addHandler(_RateLimitLogHandler(logging.WARNING))
+
+
+async def monitor_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - start - interval))
@@ -0,0 +1,145 @@
+import logging
+import os
+
+from sqlalchemy import inspect
+
+logger = logging.getLogger("discord")
+
+
+def _add_column(conn, table, column, ddl):
+    # create_all runs before the steps and builds tables that did not exist
+    # yet from the current models, which already have the column
+    columns = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+    if column not in (row[1] for row in columns):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _constrain_user_proposal(conn):
+    # SQLite cannot add constraints to an existing table, so the association
+    # table is rebuilt, dropping duplicate and orphaned rows on the way
+    conn.exec_driver_sql(
+        "CREATE TABLE user_proposal_new ("
+        "proposal_id VARCHAR NOT NULL"
+        " REFERENCES proposals (id) ON DELETE CASCADE, "
+        "user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE, "
+        "PRIMARY KEY (proposal_id, user_id))"
+    )
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO user_proposal_new (proposal_id, user_id) "
+        "SELECT proposal_id, user_id FROM user_proposal "
+        "WHERE proposal_id IN (SELECT id FROM proposals) "
+        "AND user_id IN (SELECT id FROM users)"
+    )
+    conn.exec_driver_sql("DROP TABLE user_proposal")
+    conn.exec_driver_sql(
+        "ALTER TABLE user_proposal_new RENAME TO user_proposal"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_proposal_user_id "
+        "ON user_proposal (user_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_proposals_deadline "
+        "ON proposals (deadline)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_users_subscribed_to_all "
+        "ON users (subscribed_to_all)"
+    )
+
+
+def _scope_proposals_by_guild(conn):
+    # Proposal ids become "<guild_id>:<name>"; rows from the single-guild
+    # days belong to SERVER_ID
+    _add_column(conn, "proposals", "guild_id", "BIGINT")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_proposals_guild_id "
+        "ON proposals (guild_id)"
+    )
+    if conn.exec_driver_sql("SELECT count(*) FROM proposals").scalar() == 0:
+        return
+    server_id = os.getenv("SERVER_ID")
+    if not server_id:
+        raise RuntimeError(
+            "SERVER_ID is required to migrate existing proposals"
+        )
+    prefix = f"{int(server_id)}:"
+
+    # The ids are rewritten in place; the references are only checked at
+    # commit, by which point both sides agree again
+    conn.exec_driver_sql("PRAGMA defer_foreign_keys = ON")
+    conn.exec_driver_sql(
+        "UPDATE proposals SET guild_id = ?, id = ? || id",
+        (int(server_id), prefix),
+    )
+    conn.exec_driver_sql(
+        "UPDATE user_proposal SET proposal_id = ? || proposal_id", (prefix,)
+    )
+    conn.exec_driver_sql(
+        "UPDATE outbox SET payload = json_set(payload, '$.proposal_id', "
+        "? || json_extract(payload, '$.proposal_id')) "
+        "WHERE status = 'pending' "
+        "AND json_extract(payload, '$.proposal_id') IS NOT NULL",
+        (prefix,),
+    )
+
+
+def _route_outbox_by_guild(conn):
+    _add_column(conn, "outbox", "guild_id", "BIGINT")
+    conn.exec_driver_sql(
+        "UPDATE outbox SET guild_id = json_extract(payload, '$.guild_id')"
+    )
+
+
+def _route_proposal_buttons(conn):
+    # Buttons used to share the custom_ids "veto" and "subscribe"; every
+    # posted proposal gets its buttons rewritten to the templated ids
+    # through the outbox
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO outbox "
+        "(key, guild_id, kind, payload, priority, status, attempts, "
+        "next_attempt_at, created_at) "
+        "SELECT id || ':components', guild_id, 'components', "
+        "json_object('message_id', message_id, 'proposal_id', id, "
+        "'guild_id', guild_id), 2, 'pending', 0, 0, datetime('now') "
+        "FROM proposals WHERE message_id IS NOT NULL"
+    )
+
+
+# MIGRATIONS[n] upgrades a database from schema version n to n + 1
+MIGRATIONS = [
+    _constrain_user_proposal,
+    _scope_proposals_by_guild,
+    _route_outbox_by_guild,
+    _route_proposal_buttons,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def set_schema_version(conn, version):
+    conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(engine, metadata):
+    with engine.begin() as conn:
+        if conn.dialect.name != "sqlite":
+            # The upgrade steps only exist for legacy SQLite files
+            metadata.create_all(conn)
+            return
+
+        fresh = not inspect(conn).has_table("proposals")
+        metadata.create_all(conn)
+        if fresh:
+            set_schema_version(conn, SCHEMA_VERSION)
+            return
+
+        version = get_schema_version(conn)
+        for step in MIGRATIONS[version:]:
+            logger.info(f"Migrating database schema to version {version + 1}")
+            step(conn)
+            version += 1
+            set_schema_version(conn, version)
@@ -1,3 +1,4 @@
+import os
 from sqlalchemy import (
     ForeignKey,
     Column,
@@ -6,42 +7,163 @@ from sqlalchemy import (
     Table,
     Boolean,
     BigInteger,
+    Float,
+    Index,
+    event,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import backref, relationship, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy import DateTime
 from datetime import datetime
+from dotenv import load_dotenv
+from migrations import migrate
+
+load_dotenv()
+
+DEFAULT_DATABASE_URL = "sqlite:///proposals.db"
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    # Negative values are KiB rather than pages
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024)),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "temp_store": "MEMORY",
+    # SQLite only enforces ON DELETE CASCADE when asked to, per connection
+    "foreign_keys": "ON",
+}
 
 Base = declarative_base()
 
 user_proposal = Table(
     "user_proposal",
     Base.metadata,
-    Column("user_id", BigInteger, ForeignKey("users.id")),
-    Column("proposal_id", String, ForeignKey("proposals.id")),
+    Column(
+        "proposal_id",
+        String,
+        ForeignKey("proposals.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "user_id",
+        BigInteger,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Index("ix_user_proposal_user_id", "user_id"),
 )
 
 
 class Proposal(Base):
     __tablename__ = "proposals"
 
+    # "<guild_id>:<normalised name>"
     id = Column(String, primary_key=True)
+    guild_id = Column(BigInteger, index=True)
     name = Column(String)
-    deadline = Column(Integer)
-    message_id = Column(Integer)
+    deadline = Column(Integer, index=True)
+    message_id = Column(BigInteger)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class User(Base):
     __tablename__ = "users"
     id = Column(BigInteger, primary_key=True)
-    subscribed_to_all = Column(Boolean, default=False)
+    subscribed_to_all = Column(Boolean, default=False, index=True)
     subscribed_to = relationship(
-        "Proposal", secondary=user_proposal, backref="subscribers"
+        "Proposal",
+        secondary=user_proposal,
+        backref=backref("subscribers", passive_deletes=True),
+        passive_deletes=True,
     )
 
 
-engine = create_engine("sqlite:///proposals.db")
-Base.metadata.create_all(engine)
+class GuildSettings(Base):
+    # Per-guild overrides; unset columns fall back to the process defaults
+    __tablename__ = "guild_settings"
+
+    guild_id = Column(BigInteger, primary_key=True)
+    output_channel_id = Column(BigInteger)
+    output_channel_name = Column(String)
+    timeout_seconds = Column(Integer)
+    required_role_id = Column(BigInteger)
+
+
+class OutboundAction(Base):
+    # Discord side effects waiting to be delivered; written in the same
+    # transaction as the state change that caused them
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True, nullable=False)
+    # Routes the action to the worker that owns the guild's shard
+    guild_id = Column(BigInteger)
+    kind = Column(String, nullable=False)
+    payload = Column(String, nullable=False)
+    priority = Column(Integer, default=0, nullable=False)
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(Float, default=0, nullable=False)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(Float)
+
+    __table_args__ = (
+        Index("ix_outbox_due", "status", "priority", "next_attempt_at"),
+    )
+
+
+class ShardLease(Base):
+    # Which worker process currently acts for a gateway shard
+    __tablename__ = "shard_leases"
+
+    shard_id = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
+
+
+def make_engine(url=None, pragmas=None):
+    url = url or os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+    pool_size = int(os.getenv("DB_POOL_SIZE", 5))
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            pool_pre_ping=True,
+        )
+
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        # Every connection to :memory: is a separate database
+        engine = create_engine(
+            url,
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+    else:
+        engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=0,
+            connect_args={"check_same_thread": False},
+        )
+
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+engine = make_engine()
+migrate(engine, Base.metadata)
 Session = sessionmaker(bind=engine)
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import discord
+
+import metrics
+
+# Opening DM channels shares one bucket across the bot, message sends are
+# bucketed per channel by Discord and additionally capped globally.
+DM_OPEN_RATE = (5, 1.0)
+GLOBAL_SEND_RATE = (40, 1.0)
+
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated) * self.capacity / self.period,
+        )
+        self._updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            # Created lazily so the lock binds to the bot's loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep(
+                    (1 - self._tokens) * self.period / self.capacity
+                )
+                self._refill()
+            self._tokens -= 1
+
+    def penalise(self, retry_after):
+        # A 429 means the server-side bucket is empty regardless of ours
+        self._tokens = min(self._tokens, 0) - retry_after * (
+            self.capacity / self.period
+        )
+
+
+class NotificationDispatcher:
+    def __init__(self, client: discord.Client):
+        self.client = client
+        self.dm_open_bucket = TokenBucket(*DM_OPEN_RATE)
+        self.send_bucket = TokenBucket(*GLOBAL_SEND_RATE)
+
+    async def _dm_channel(self, user_id):
+        user = self.client.get_user(user_id)
+        if user is not None and user.dm_channel is not None:
+            return user.dm_channel
+        await self.dm_open_bucket.acquire()
+        return await self.client.create_dm(discord.Object(id=user_id))
+
+    async def send_one(self, user_id, content):
+        # Raises on failure, for callers that retry on their own
+        try:
+            channel = await self._dm_channel(user_id)
+            await self.send_bucket.acquire()
+            await channel.send(content)
+        except Exception as e:
+            if isinstance(e, discord.HTTPException) and e.status == 429:
+                self.send_bucket.penalise(getattr(e, "retry_after", 1.0))
+            metrics.dm_sends.inc(result="failed")
+            raise
+        metrics.dm_sends.inc(result="delivered")
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from functools import partial
+
+import discord
+
+from notifications import TokenBucket
+
+logger = logging.getLogger("discord")
+
+OUTBOX_RATE = (5, 1.0)
+OUTBOX_CONCURRENCY = 4
+# Actions claimed ahead of delivery, per concurrent delivery
+WINDOW_PER_WORKER = 4
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 600.0
+MAX_ATTEMPTS = 8
+PROGRESS_INTERVAL = 5.0
+# Finished actions are kept this long so a repeated key stays a no-op
+RETENTION = 24 * 60 * 60
+PRUNE_INTERVAL = 60 * 60
+
+
+class PermanentFailure(Exception):
+    pass
+
+
+def action(key, kind, priority=0, guild_id=None, **payload):
+    # Lower priorities are delivered first; handlers are called with the
+    # payload and guild_id
+    return {
+        "key": key,
+        "kind": kind,
+        "priority": priority,
+        "guild_id": guild_id,
+        "payload": json.dumps(dict(payload, guild_id=guild_id)),
+    }
+
+
+def backoff(attempts):
+    delay = min(MAX_BACKOFF, BASE_BACKOFF * 2**attempts)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _is_permanent(error):
+    if isinstance(error, PermanentFailure):
+        return True
+    if isinstance(error, discord.HTTPException):
+        # 4xx other than rate limits will fail the same way every time
+        return 400 <= error.status < 500 and error.status != 429
+    return False
+
+
+class Outbox:
+    def __init__(
+        self,
+        repo,
+        rate=OUTBOX_RATE,
+        concurrency=OUTBOX_CONCURRENCY,
+        shards=None,
+    ):
+        self.repo = repo
+        # Called for the (shard_count, shard_ids) to deliver for when other
+        # workers drain the rest
+        self.shards = shards
+        self.bucket = TokenBucket(*rate)
+        self.concurrency = concurrency
+        self.handlers = {}
+        # Kinds whose handlers pace their own requests
+        self.self_paced = set()
+        self.pending = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self._wake = None
+        self._idle = None
+        self._task = None
+        self._in_flight = {}
+        self._results = []
+
+    def handler(self, kind, paced=False):
+        # paced handlers keep to their own rate limits instead of the
+        # outbox's shared bucket
+        def decorator(func):
+            self.handlers[kind] = func
+            if paced:
+                self.self_paced.add(kind)
+            return func
+
+        return decorator
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def enqueue(self, actions):
+        await self.repo.enqueue_actions(actions)
+        self.wake()
+
+    def start(self):
+        if self._wake is None:
+            # Created lazily so the events bind to the bot's loop
+            self._wake = asyncio.Event()
+            self._idle = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def drain(self, timeout):
+        # Keeps delivering until nothing is due or timeout runs out, then
+        # stops; anything left is picked up on the next start
+        if self._task is not None and not self._task.done():
+            self._idle.clear()
+            self.wake()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Outbox: stopping with {len(self._in_flight)} deliveries "
+                    f"under way and {self.pending} pending"
+                )
+        await self.stop(0)
+
+    async def stop(self, timeout=None):
+        # Deliveries already started get up to timeout seconds to finish,
+        # and whatever finished is recorded
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._in_flight:
+            done, pending = await asyncio.wait(
+                list(self._in_flight.values()), timeout=timeout
+            )
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        await self._record()
+
+    def _finished(self, action_id, task):
+        # Stays in flight until recorded, or the next claim would pick the
+        # row up again
+        if task.cancelled():
+            self._in_flight.pop(action_id, None)
+        else:
+            self._results.append(task.result())
+        self.wake()
+
+    async def _record(self):
+        if not self._results:
+            return
+        results, self._results = self._results, []
+        try:
+            # One transaction for every delivery that finished since the
+            # last round
+            await self.repo.record_attempts(results)
+        except Exception:
+            logger.exception("Outbox: failed to record results")
+            await asyncio.sleep(BASE_BACKOFF)
+        for result in results:
+            self._in_flight.pop(result["id"], None)
+
+    async def _run(self):
+        last_progress = last_prune = 0.0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        window = self.concurrency * WINDOW_PER_WORKER
+
+        async def deliver(row):
+            async with semaphore:
+                return await self._deliver(row)
+
+        while True:
+            self._wake.clear()
+            await self._record()
+            due = []
+            next_at = None
+            try:
+                now = time.time()
+                if now - last_prune >= PRUNE_INTERVAL:
+                    pruned = await self.repo.prune_actions(now - RETENTION)
+                    if pruned:
+                        logger.info(f"Outbox: pruned {pruned} old actions")
+                    last_prune = now
+
+                # Deliveries run as a rolling window, topped up once a
+                # worker's worth of room frees up, so one slow action never
+                # holds back the rest
+                shards = self.shards() if self.shards else None
+                room = window - len(self._in_flight)
+                if room >= self.concurrency and (shards is None or shards[1]):
+                    due = await self.repo.due_actions(
+                        now, room, shards, exclude=list(self._in_flight)
+                    )
+                # Counting is only needed to report progress or to know how
+                # long to sleep
+                idle = not due and not self._in_flight
+                if idle or now - last_progress >= PROGRESS_INTERVAL:
+                    self.pending, next_at = await self.repo.action_backlog(
+                        shards
+                    )
+                    if (
+                        self.pending
+                        and now - last_progress >= PROGRESS_INTERVAL
+                    ):
+                        logger.info(
+                            f"Outbox: {self.pending} pending, "
+                            f"{self.delivered} delivered, {self.failed} failed"
+                        )
+                        last_progress = now
+            except Exception:
+                logger.exception("Outbox: failed to read pending actions")
+                await asyncio.sleep(BASE_BACKOFF)
+                continue
+
+            for row in due:
+                task = asyncio.create_task(deliver(row))
+                self._in_flight[row[0]] = task
+                task.add_done_callback(partial(self._finished, row[0]))
+            if due:
+                continue
+
+            # A finishing delivery wakes the loop, so only an idle outbox
+            # needs to time its next attempt
+            timeout = None
+            if not self._in_flight:
+                self._idle.set()
+                if next_at is not None:
+                    timeout = max(0.0, next_at - now)
+                if shards is not None:
+                    # Leases gained meanwhile bring rows nobody wakes us for
+                    timeout = (
+                        PROGRESS_INTERVAL
+                        if timeout is None
+                        else min(timeout, PROGRESS_INTERVAL)
+                    )
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, row):
+        action_id, kind, payload, attempts = row
+        result = {
+            "id": action_id,
+            "status": "pending",
+            "attempts": attempts + 1,
+            "next_attempt_at": 0,
+            "last_error": None,
+            "finished_at": None,
+        }
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise PermanentFailure(f"no handler for {kind!r}")
+            if kind not in self.self_paced:
+                await self.bucket.acquire()
+            await handler(**json.loads(payload))
+        except Exception as e:
+            error = result["last_error"] = f"{type(e).__name__}: {e}"
+            if _is_permanent(e) or result["attempts"] >= MAX_ATTEMPTS:
+                self.failed += 1
+                logger.warning(
+                    f"Outbox: giving up on {kind} action {action_id} "
+                    f"after {result['attempts']} attempts: {error}"
+                )
+                result["status"] = "failed"
+                result["finished_at"] = time.time()
+                return result
+            delay = backoff(result["attempts"])
+            if isinstance(e, discord.HTTPException) and e.status == 429:
+                retry_after = getattr(e, "retry_after", 1.0)
+                if kind not in self.self_paced:
+                    self.bucket.penalise(retry_after)
+                delay = max(delay, retry_after)
+            self.retried += 1
+            logger.info(
+                f"Outbox: retrying {kind} action {action_id} "
+                f"in {delay:.1f}s: {error}"
+            )
+            result["next_attempt_at"] = time.time() + delay
+        else:
+            self.delivered += 1
+            result["status"] = "delivered"
+            result["finished_at"] = time.time()
+        return result
@@ -0,0 +1,115 @@
+from typing import List
+
+import discord
+
+# Embed descriptions hold up to 4096 characters
+DESCRIPTION_LIMIT = 4096
+PAGINATOR_TIMEOUT = 300
+
+
+def _split(text, limit):
+    # Only for a single item longer than a page: break on newlines where
+    # possible, hard-cut otherwise
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        parts.append(text)
+    return parts
+
+
+def chunk(items, limit=DESCRIPTION_LIMIT, per_page=None, separator="\n"):
+    # Packs whole items into pages of at most limit characters and per_page
+    # items
+    pages = []
+    page = []
+    size = 0
+    for item in items:
+        for part in _split(item, limit):
+            added = len(part) + (len(separator) if page else 0)
+            if page and (
+                size + added > limit or (per_page and len(page) >= per_page)
+            ):
+                pages.append(separator.join(page))
+                page, size, added = [], 0, len(part)
+            page.append(part)
+            size += added
+    if page:
+        pages.append(separator.join(page))
+    return pages
+
+
+def embed_pages(title, chunks, colour=None) -> List[discord.Embed]:
+    embeds = []
+    for i, text in enumerate(chunks, start=1):
+        embed = discord.Embed(title=title, description=text, colour=colour)
+        if len(chunks) > 1:
+            embed.set_footer(text=f"Page {i}/{len(chunks)}")
+        embeds.append(embed)
+    return embeds
+
+
+class PageCache:
+    # Rendered pages per key, rebuilt only when the caller's version moves
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}
+
+    def get(self, key, version, build):
+        cached = self._pages.get(key)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        pages = build()
+        self._pages[key] = (version, pages)
+        return pages
+
+    def clear(self):
+        self._pages.clear()
+
+
+class Paginator(discord.ui.View):
+    def __init__(self, pages, timeout=PAGINATOR_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.index = 0
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.index >= len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, index):
+        self.index = max(0, min(index, len(self.pages) - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(
+            embed=self.pages[self.index], view=self
+        )
+
+    @discord.ui.button(label="Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await self._show(interaction, self.index - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await self._show(interaction, self.index + 1)
+
+    @classmethod
+    async def send(cls, interaction: discord.Interaction, pages, **kwargs):
+        # A single page needs no buttons
+        if len(pages) == 1:
+            await interaction.response.send_message(embed=pages[0], **kwargs)
+        else:
+            await interaction.response.send_message(
+                embed=pages[0], view=cls(pages), **kwargs
+            )
@@ -0,0 +1,246 @@
+import bisect
+from typing import Optional
+
+
+def normalise(name: str) -> str:
+    return name.lower()
+
+
+def proposal_key(guild_id, name: str) -> str:
+    return f"{guild_id}:{normalise(name)}"
+
+
+def guild_of(proposal_id: str) -> Optional[int]:
+    guild_id, sep, _ = proposal_id.partition(":")
+    return int(guild_id) if sep and guild_id.isdigit() else None
+
+
+class ProposalRecord:
+    __slots__ = (
+        "id",
+        "guild_id",
+        "name",
+        "deadline",
+        "message_id",
+        "subscribers",
+    )
+
+    def __init__(
+        self, id, guild_id, name, deadline, message_id=None, subscribers=()
+    ):
+        self.id = id
+        self.guild_id = guild_id
+        self.name = name
+        self.deadline = deadline
+        self.message_id = message_id
+        self.subscribers = set(subscribers)
+
+    def __repr__(self):
+        return f"<ProposalRecord {self.id!r} deadline={self.deadline}>"
+
+
+class ProposalRegistry:
+    def __init__(self, repo, journal=None, on_change=None):
+        self.repo = repo
+        self.journal = journal
+        # Bumped on every change so derived views know when to rebuild;
+        # on_change is called after each bump
+        self.version = 0
+        self.on_change = on_change
+        self._records = {}
+        self._by_guild = {}
+        self._by_message_id = {}
+        self._by_subscriber = {}
+        self._by_deadline = []
+        # Every id in order; ids start with the guild, so one guild's names
+        # sharing a prefix sit next to each other
+        self._sorted_ids = []
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def __contains__(self, name):
+        return normalise(name) in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def get(self, name) -> Optional[ProposalRecord]:
+        return self._records.get(normalise(name))
+
+    def values(self):
+        return self._records.values()
+
+    def for_guild(self, guild_id):
+        return [
+            self._records[proposal_id]
+            for proposal_id in self._by_guild.get(guild_id, ())
+        ]
+
+    def by_message_id(self, message_id) -> Optional[ProposalRecord]:
+        return self._by_message_id.get(message_id)
+
+    def by_subscriber(self, user_id):
+        return [
+            self._records[proposal_id]
+            for proposal_id in self._by_subscriber.get(user_id, ())
+        ]
+
+    def search(self, guild_id, prefix, limit=25):
+        # Open proposals in a guild whose name starts with prefix
+        start = proposal_key(guild_id, prefix)
+        ids = self._sorted_ids
+        i = bisect.bisect_left(ids, start)
+        found = []
+        while i < len(ids) and len(found) < limit and ids[i].startswith(start):
+            found.append(self._records[ids[i]])
+            i += 1
+        return found
+
+    def by_deadline(self, before=None):
+        entries = self._by_deadline
+        if before is not None:
+            entries = entries[: bisect.bisect_left(entries, (before,))]
+        return [self._records[proposal_id] for _, proposal_id in entries]
+
+    def _changed(self):
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    def _insert(self, record):
+        self._records[record.id] = record
+        self._by_guild.setdefault(record.guild_id, set()).add(record.id)
+        if record.message_id is not None:
+            self._by_message_id[record.message_id] = record
+        for user_id in record.subscribers:
+            self._by_subscriber.setdefault(user_id, set()).add(record.id)
+        bisect.insort(self._by_deadline, (record.deadline, record.id))
+        bisect.insort(self._sorted_ids, record.id)
+        self._changed()
+
+    def _remove(self, proposal_id) -> Optional[ProposalRecord]:
+        record = self._records.pop(proposal_id, None)
+        if record is None:
+            return None
+        guild = self._by_guild.get(record.guild_id)
+        if guild is not None:
+            guild.discard(proposal_id)
+            if not guild:
+                del self._by_guild[record.guild_id]
+        self._by_message_id.pop(record.message_id, None)
+        for user_id in record.subscribers:
+            self._unindex_subscriber(user_id, proposal_id)
+        entry = (record.deadline, record.id)
+        i = bisect.bisect_left(self._by_deadline, entry)
+        if i < len(self._by_deadline) and self._by_deadline[i] == entry:
+            del self._by_deadline[i]
+        i = bisect.bisect_left(self._sorted_ids, proposal_id)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == proposal_id:
+            del self._sorted_ids[i]
+        self._changed()
+        return record
+
+    def _unindex_subscriber(self, user_id, proposal_id):
+        proposal_ids = self._by_subscriber.get(user_id)
+        if proposal_ids is not None:
+            proposal_ids.discard(proposal_id)
+            if not proposal_ids:
+                del self._by_subscriber[user_id]
+
+    def load(self, rows):
+        for row in rows:
+            self._remove(row.id)
+            self._insert(
+                ProposalRecord(
+                    row.id,
+                    row.guild_id,
+                    row.name,
+                    row.deadline,
+                    row.message_id,
+                    row.subscribers,
+                )
+            )
+
+    # The methods below keep memory and the database in step: if the
+    # database write fails, the memory change is undone.
+
+    # actions are outbox entries committed in the same transaction as the
+    # row change; for remove they are built from the claimed record.
+
+    async def create(
+        self, guild_id, name, deadline, created_at, actions=()
+    ) -> ProposalRecord:
+        proposal_id = proposal_key(guild_id, name)
+        await self.repo.create_proposal(
+            proposal_id, guild_id, name, deadline, created_at, actions
+        )
+        record = ProposalRecord(proposal_id, guild_id, name, deadline)
+        self._insert(record)
+        if self.journal is not None:
+            self.journal.append("created", proposal_id, deadline=deadline)
+        return record
+
+    async def remove(
+        self, name, event="deleted", actions=None
+    ) -> Optional[ProposalRecord]:
+        # Claimed in memory before the write so concurrent callers see the
+        # proposal as gone
+        record = self._remove(normalise(name))
+        if record is None:
+            return None
+        try:
+            if self.journal is not None:
+                # Durable before the row goes, so a crash part-way through
+                # the transition can be finished on the next start
+                await self.journal.commit(
+                    event,
+                    record.id,
+                    name=record.name,
+                    deadline=record.deadline,
+                    message_id=record.message_id,
+                )
+            await self.repo.delete_proposal(
+                record.id, actions(record, event) if actions else ()
+            )
+        except Exception:
+            self._insert(record)
+            if self.journal is not None:
+                self.journal.append("restored", record.id)
+            raise
+        return record
+
+    async def subscribe(self, name, user_id) -> bool:
+        record = self.get(name)
+        if record is None or user_id in record.subscribers:
+            return False
+        record.subscribers.add(user_id)
+        self._by_subscriber.setdefault(user_id, set()).add(record.id)
+        try:
+            await self.repo.add_subscriber(record.id, user_id)
+        except Exception:
+            record.subscribers.discard(user_id)
+            self._unindex_subscriber(user_id, record.id)
+            raise
+        self._changed()
+        if self.journal is not None:
+            self.journal.append("subscribed", record.id, user_id=user_id)
+        return True
+
+    async def set_message_id(self, name, message_id):
+        record = self.get(name)
+        if record is None:
+            return
+        await self.repo.set_message_id(record.id, message_id)
+        self._by_message_id.pop(record.message_id, None)
+        record.message_id = message_id
+        self._by_message_id[message_id] = record
+        self._changed()
+
+    def discard(self, name) -> Optional[ProposalRecord]:
+        # Memory only, for rolling back a proposal whose row is handled
+        # separately
+        return self._remove(normalise(name))
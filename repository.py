@@ -0,0 +1,376 @@
+import asyncio
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import (
+    Session,
+    GuildSettings,
+    OutboundAction,
+    Proposal,
+    ShardLease,
+    User,
+    user_proposal,
+)
+
+ProposalRow = namedtuple(
+    "ProposalRow",
+    [
+        "id",
+        "guild_id",
+        "name",
+        "deadline",
+        "message_id",
+        "created_at",
+        "subscribers",
+    ],
+)
+
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+
+def _load_rows(session, proposal_ids=None):
+    # One outer join over user_proposal instead of a lazy load per proposal
+    query = (
+        select(
+            Proposal.id,
+            Proposal.guild_id,
+            Proposal.name,
+            Proposal.deadline,
+            Proposal.message_id,
+            Proposal.created_at,
+            user_proposal.c.user_id,
+        )
+        .outerjoin(user_proposal, user_proposal.c.proposal_id == Proposal.id)
+        .order_by(Proposal.id)
+    )
+    if proposal_ids is None:
+        results = session.execute(query)
+    else:
+        proposal_ids = list(proposal_ids)
+        results = []
+        for i in range(0, len(proposal_ids), BATCH_SIZE):
+            batch = proposal_ids[i : i + BATCH_SIZE]
+            results.extend(session.execute(query.where(Proposal.id.in_(batch))))
+
+    rows = {}
+    for result in results:
+        row = rows.get(result.id)
+        if row is None:
+            row = rows[result.id] = ProposalRow(
+                result.id,
+                result.guild_id,
+                result.name,
+                result.deadline,
+                result.message_id,
+                result.created_at,
+                [],
+            )
+        if result.user_id is not None:
+            row.subscribers.append(result.user_id)
+    return list(rows.values())
+
+
+def _add_actions(session, actions):
+    # Keys that were already enqueued, delivered or not, are skipped, which
+    # makes writing the same transition twice harmless
+    actions = list(actions)
+    keys = [action["key"] for action in actions]
+    existing = set()
+    for i in range(0, len(keys), BATCH_SIZE):
+        existing.update(
+            session.scalars(
+                select(OutboundAction.key).where(
+                    OutboundAction.key.in_(keys[i : i + BATCH_SIZE])
+                )
+            )
+        )
+    rows = []
+    for action in actions:
+        if action["key"] not in existing:
+            existing.add(action["key"])
+            rows.append(action)
+    if rows:
+        # Core executemany; fan-outs can be thousands of rows
+        session.execute(insert(OutboundAction), rows)
+
+
+def _in_shards(guild_id, shards):
+    # Discord's guild -> shard mapping, done by the database; rows without a
+    # guild go to shard 0
+    shard_count, shard_ids = shards
+    return (func.coalesce(guild_id, 0).op(">>")(22) % shard_count).in_(
+        shard_ids
+    )
+
+
+class ProposalRepository:
+    # All queries run on one dedicated thread: SQLite allows a single writer
+    # anyway, and the event loop never waits on disk I/O.
+    def __init__(self, session_factory=Session):
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db"
+        )
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self._in_session, fn, *args)
+        )
+
+    def _in_session(self, fn, *args):
+        session = self.session_factory()
+        try:
+            result = fn(session, *args)
+            with metrics.db_commit.time():
+                session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    async def load_proposals(self, proposal_ids=None):
+        return await self.run(_load_rows, proposal_ids)
+
+    async def load_subscribed_users(self):
+        def query(session):
+            return set(
+                user_id
+                for (user_id,) in session.query(User.id).filter_by(
+                    subscribed_to_all=True
+                )
+            )
+
+        return await self.run(query)
+
+    async def create_proposal(
+        self, proposal_id, guild_id, name, deadline, created_at, actions=()
+    ):
+        def query(session):
+            session.add(
+                Proposal(
+                    id=proposal_id,
+                    guild_id=guild_id,
+                    name=name,
+                    deadline=deadline,
+                    created_at=created_at,
+                )
+            )
+            # Flushed first so a duplicate proposal fails before its actions
+            session.flush()
+            _add_actions(session, actions)
+
+        await self.run(query)
+
+    async def set_message_id(self, proposal_id, message_id):
+        def query(session):
+            proposal = session.get(Proposal, proposal_id)
+            if proposal:
+                proposal.message_id = message_id
+            return proposal is not None
+
+        return await self.run(query)
+
+    async def extend_deadlines(self, deadlines, actions=()):
+        def query(session):
+            _add_actions(session, actions)
+            session.execute(
+                update(Proposal),
+                [
+                    {"id": proposal_id, "deadline": deadline}
+                    for proposal_id, deadline in deadlines.items()
+                ],
+            )
+            return _load_rows(session, deadlines)
+
+        return await self.run(query)
+
+    async def delete_proposal(self, proposal_id, actions=()):
+        def query(session):
+            proposal = session.get(Proposal, proposal_id)
+            if proposal:
+                session.delete(proposal)
+            _add_actions(session, actions)
+            return proposal is not None
+
+        return await self.run(query)
+
+    async def add_subscriber(self, proposal_id, user_id):
+        def query(session):
+            proposal = session.get(Proposal, proposal_id)
+            if proposal is None:
+                return False
+            if session.get(User, user_id) is None:
+                session.add(User(id=user_id))
+                session.flush()
+            # Primary key lookup on (proposal_id, user_id)
+            subscribed = session.execute(
+                select(user_proposal.c.user_id).where(
+                    user_proposal.c.proposal_id == proposal_id,
+                    user_proposal.c.user_id == user_id,
+                )
+            ).first()
+            if subscribed is None:
+                session.execute(
+                    user_proposal.insert().values(
+                        proposal_id=proposal_id, user_id=user_id
+                    )
+                )
+            return True
+
+        return await self.run(query)
+
+    async def set_global_subscription(self, user_id, subscribed):
+        # Returns whether anything changed
+        def query(session):
+            user = session.get(User, user_id)
+            if user:
+                changed = bool(user.subscribed_to_all) != subscribed
+                user.subscribed_to_all = subscribed
+                return changed
+            if subscribed:
+                session.add(User(id=user_id, subscribed_to_all=True))
+            return subscribed
+
+        return await self.run(query)
+
+    async def claim_shards(self, owner, shard_ids, now, expires_at):
+        # Takes every lease that is free, expired or already ours. Each claim
+        # is a compare-and-set, so two workers racing for an expired lease
+        # cannot both come away holding it.
+        def query(session):
+            held = []
+            for shard_id in shard_ids:
+                claimed = session.execute(
+                    update(ShardLease)
+                    .where(
+                        ShardLease.shard_id == shard_id,
+                        (ShardLease.owner == owner)
+                        | (ShardLease.expires_at < now),
+                    )
+                    .values(owner=owner, expires_at=expires_at)
+                ).rowcount
+                if not claimed:
+                    try:
+                        with session.begin_nested():
+                            session.execute(
+                                insert(ShardLease).values(
+                                    shard_id=shard_id,
+                                    owner=owner,
+                                    expires_at=expires_at,
+                                )
+                            )
+                    except IntegrityError:
+                        # Leased by someone else, or just now created by them
+                        continue
+                held.append(shard_id)
+            return held
+
+        return await self.run(query)
+
+    async def release_shards(self, owner):
+        def query(session):
+            session.execute(
+                update(ShardLease)
+                .where(ShardLease.owner == owner)
+                .values(expires_at=0)
+            )
+
+        await self.run(query)
+
+    async def load_guild_settings(self):
+        def query(session):
+            return [
+                {
+                    column.name: getattr(settings, column.name)
+                    for column in GuildSettings.__table__.columns
+                }
+                for settings in session.scalars(select(GuildSettings))
+            ]
+
+        return await self.run(query)
+
+    async def save_guild_settings(self, guild_id, **fields):
+        def query(session):
+            settings = session.get(GuildSettings, guild_id)
+            if settings is None:
+                settings = GuildSettings(guild_id=guild_id)
+                session.add(settings)
+            for name, value in fields.items():
+                setattr(settings, name, value)
+
+        await self.run(query)
+
+    async def enqueue_actions(self, actions):
+        await self.run(_add_actions, actions)
+
+    async def due_actions(self, now, limit, shards=None, exclude=()):
+        def query(session):
+            conditions = [
+                OutboundAction.status == "pending",
+                OutboundAction.next_attempt_at <= now,
+            ]
+            if exclude:
+                # Already being delivered
+                conditions.append(OutboundAction.id.notin_(list(exclude)))
+            if shards is not None:
+                conditions.append(_in_shards(OutboundAction.guild_id, shards))
+            return session.execute(
+                select(
+                    OutboundAction.id,
+                    OutboundAction.kind,
+                    OutboundAction.payload,
+                    OutboundAction.attempts,
+                )
+                .where(*conditions)
+                .order_by(
+                    OutboundAction.priority, OutboundAction.next_attempt_at
+                )
+                .limit(limit)
+            ).all()
+
+        return await self.run(query)
+
+    async def action_backlog(self, shards=None):
+        # (pending count, earliest next attempt)
+        def query(session):
+            conditions = [OutboundAction.status == "pending"]
+            if shards is not None:
+                conditions.append(_in_shards(OutboundAction.guild_id, shards))
+            return session.execute(
+                select(
+                    func.count(), func.min(OutboundAction.next_attempt_at)
+                ).where(*conditions)
+            ).one()
+
+        return await self.run(query)
+
+    async def record_attempts(self, results):
+        def query(session):
+            # Bulk UPDATE by primary key, one statement per batch
+            session.execute(update(OutboundAction), results)
+
+        await self.run(query)
+
+    async def prune_actions(self, before):
+        def query(session):
+            return session.execute(
+                delete(OutboundAction).where(
+                    OutboundAction.status != "pending",
+                    OutboundAction.finished_at < before,
+                )
+            ).rowcount
+
+        return await self.run(query)
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger("discord")
+
+_CANCELLED = object()
+
+
+class DeadlineScheduler:
+    def __init__(self, callback, clock=time.time):
+        # callback receives every key that fell due in the same wake-up
+        self.callback = callback
+        self.clock = clock
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._wakeup = None
+        self._task = None
+        self._batches = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def pending(self):
+        return len(self._entries)
+
+    def deadline(self, key) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def schedule(self, key, deadline):
+        if key in self._entries:
+            self._discard(key)
+        entry = [deadline, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+
+    reschedule = schedule
+
+    def cancel(self, key) -> bool:
+        if key not in self._entries:
+            return False
+        self._discard(key)
+        return True
+
+    def next_deadline(self) -> Optional[float]:
+        heap = self._heap
+        while heap and heap[0][2] is _CANCELLED:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+        return heap[0][0] if heap else None
+
+    def _discard(self, key):
+        # Lazy deletion keeps cancel O(1); the heap is compacted once
+        # tombstones outnumber live entries
+        entry = self._entries.pop(key)
+        entry[2] = _CANCELLED
+        self._cancelled += 1
+        if self._cancelled > 64 and self._cancelled > len(self._entries):
+            self._heap = [e for e in self._heap if e[2] is not _CANCELLED]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def _pop_due(self, now):
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, key = heapq.heappop(heap)
+            if key is _CANCELLED:
+                self._cancelled -= 1
+                continue
+            del self._entries[key]
+            due.append(key)
+        return due
+
+    def start(self):
+        if self._task is None or self._task.done():
+            # Created here so the event binds to the bot's loop
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=None):
+        # Deadlines that are already due still go out, and batches under way
+        # get up to timeout seconds to finish
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        due = self._pop_due(self.clock())
+        if due:
+            batch = asyncio.create_task(self._dispatch(due))
+            self._batches.add(batch)
+            batch.add_done_callback(self._batches.discard)
+        if self._batches:
+            _, pending = await asyncio.wait(
+                list(self._batches), timeout=timeout
+            )
+            for batch in pending:
+                batch.cancel()
+            if pending:
+                logger.warning(
+                    f"Cancelled {len(pending)} deadline batches at shutdown"
+                )
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else deadline - self.clock()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = self._pop_due(self.clock())
+            if due:
+                batch = asyncio.create_task(self._dispatch(due))
+                self._batches.add(batch)
+                batch.add_done_callback(self._batches.discard)
+
+    async def _dispatch(self, keys):
+        try:
+            await self.callback(keys)
+        except Exception:
+            logger.exception(f"Error dispatching expired deadlines {keys}")
@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import json
+from types import MappingProxyType
+
+# Changes within this many seconds are published together
+PUBLISH_DELAY = 0.5
+
+
+def etag(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+
+def etag_matches(if_none_match, tag) -> bool:
+    # If-None-Match holds "*" or a list of quoted, possibly weak, tags
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == tag:
+            return True
+    return False
+
+
+class Snapshot:
+    # Never modified once built; readers on other threads only ever follow
+    # the publisher's reference to the current one
+    __slots__ = ("version", "items", "body", "etag")
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = MappingProxyType(items)
+        self.body = json.dumps(
+            {"proposals": list(items.values())}, separators=(",", ":")
+        ).encode()
+        self.etag = etag(self.body)
+
+    def item(self, item_id):
+        # (body, etag) of one entry, or None
+        entry = self.items.get(item_id)
+        if entry is None:
+            return None
+        body = json.dumps(entry, separators=(",", ":")).encode()
+        return body, etag(body)
+
+
+class SnapshotPublisher:
+    # build is called on the event loop and returns (version, {id: dict})
+    def __init__(self, build, delay=PUBLISH_DELAY):
+        self.build = build
+        self.delay = delay
+        self.current = Snapshot(0, {})
+        self.published = 0
+        self._scheduled = None
+
+    def changed(self):
+        if self._scheduled is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop yet, e.g. while hydrating before the bot starts
+            self.publish()
+            return
+        self._scheduled = loop.call_later(self.delay, self.publish)
+
+    def publish(self):
+        self._scheduled = None
+        version, items = self.build()
+        if version != self.current.version:
+            self.current = Snapshot(version, items)
+            self.published += 1
@@ -0,0 +1,60 @@
+import os
+import time
+import unittest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import models  # noqa: E402
+from cluster import Cluster  # noqa: E402
+from repository import ProposalRepository  # noqa: E402
+
+
+class ClaimShardsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = models.make_engine("sqlite://", pragmas={})
+        models.Base.metadata.create_all(engine)
+        self.repo = ProposalRepository(sessionmaker(bind=engine))
+        self.addCleanup(self.repo.shutdown)
+
+    async def test_new_leases_are_claimed(self):
+        held = await self.repo.claim_shards("a", [0, 1], 100, 130)
+        self.assertEqual(held, [0, 1])
+
+    async def test_live_lease_is_not_taken(self):
+        await self.repo.claim_shards("a", [0], 100, 130)
+        self.assertEqual(await self.repo.claim_shards("b", [0], 110, 140), [])
+        # The holder renews its own lease
+        self.assertEqual(await self.repo.claim_shards("a", [0], 110, 140), [0])
+
+    async def test_expired_lease_goes_to_one_claimant(self):
+        await self.repo.claim_shards("a", [0], 100, 130)
+        self.assertEqual(await self.repo.claim_shards("b", [0], 131, 161), [0])
+        self.assertEqual(await self.repo.claim_shards("c", [0], 132, 162), [])
+
+    async def test_released_leases_are_free(self):
+        await self.repo.claim_shards("a", [0], 100, 130)
+        await self.repo.release_shards("a")
+        self.assertEqual(await self.repo.claim_shards("b", [0], 110, 140), [0])
+
+
+class LeaseFilterTest(unittest.TestCase):
+    def test_unpartitioned_has_no_filter(self):
+        self.assertIsNone(Cluster().lease_filter())
+
+    def test_only_held_shards_are_listed(self):
+        cluster = Cluster("workers", 4, worker_index=0, worker_count=2)
+        cluster._held = {2}
+        cluster._held_until = time.time() + 30
+        self.assertEqual(cluster.lease_filter(), (4, [2]))
+
+    def test_lapsed_leases_list_nothing(self):
+        cluster = Cluster("workers", 4, worker_index=0, worker_count=2)
+        cluster._held = {0, 2}
+        cluster._held_until = time.time() - 1
+        self.assertEqual(cluster.lease_filter(), (4, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("SERVER_ID", "1")
+os.environ.setdefault(
+    "JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "proposals.journal")
+)
+
+import discord  # noqa: E402
+
+import index  # noqa: E402
+from components import ComponentRouter  # noqa: E402
+from guild_config import GuildConfig  # noqa: E402
+
+GUILD_ID = 42
+ROLE_ID = 7
+
+
+def member(*role_ids, manage_guild=False):
+    user = mock.MagicMock(spec=discord.Member)
+    user.id = 1234
+    user.get_role.side_effect = lambda role_id: (
+        object() if role_id in role_ids else None
+    )
+    user.guild_permissions.manage_guild = manage_guild
+    return user
+
+
+def press(custom_id, user):
+    interaction = mock.MagicMock()
+    interaction.type = discord.InteractionType.component
+    interaction.data = {"custom_id": custom_id}
+    interaction.guild_id = GUILD_ID
+    interaction.user = user
+    interaction.response.send_message = mock.AsyncMock()
+    return interaction
+
+
+class ComponentRouterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_dispatches_by_action_and_target(self):
+        router = ComponentRouter("proposal")
+        handler = mock.AsyncMock()
+        router.route("veto", "veto")(handler)
+
+        interaction = press("proposal:veto:alice", None)
+        self.assertTrue(await router.dispatch(interaction))
+        handler.assert_awaited_once_with(interaction, "alice")
+
+        legacy = press("veto", None)
+        self.assertTrue(await router.dispatch(legacy))
+        handler.assert_awaited_with(legacy, None)
+
+    async def test_ignores_other_components(self):
+        router = ComponentRouter("proposal")
+        interaction = press("page:next", None)
+        self.assertFalse(router.owns(interaction))
+        self.assertFalse(await router.dispatch(interaction))
+
+
+class RoutedRoleGateTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        config = GuildConfig(GUILD_ID, None, None, None, ROLE_ID)
+        self._enter(
+            mock.patch.object(index.guild_configs, "get", return_value=config)
+        )
+        self.proposal = mock.MagicMock(id="alice")
+        self._enter(
+            mock.patch.object(
+                index, "pressed_proposal", return_value=self.proposal
+            )
+        )
+        self.veto = self._enter(
+            mock.patch.object(index, "veto_proposal", mock.AsyncMock())
+        )
+
+    def _enter(self, cm):
+        # TestCase.enterContext, which unittest only gained in 3.11
+        result = cm.__enter__()
+        self.addCleanup(cm.__exit__, None, None, None)
+        return result
+
+    async def test_roleless_member_cannot_veto(self):
+        interaction = press("proposal:confirm_veto:alice", member())
+        await index.route_components(interaction)
+
+        self.veto.assert_not_awaited()
+        interaction.response.send_message.assert_awaited_once()
+        self.assertTrue(
+            interaction.response.send_message.call_args.kwargs["ephemeral"]
+        )
+
+    async def test_member_with_role_can_veto(self):
+        interaction = press("proposal:confirm_veto:alice", member(ROLE_ID))
+        await index.route_components(interaction)
+
+        self.veto.assert_awaited_once_with(interaction, "alice")
+
+    async def test_admin_without_role_can_veto(self):
+        interaction = press(
+            "proposal:confirm_veto:alice", member(manage_guild=True)
+        )
+        await index.route_components(interaction)
+
+        self.veto.assert_awaited_once_with(interaction, "alice")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import journal
+from journal import Journal
+
+
+def line(event, proposal_id=None, ts=1.0):
+    return (
+        json.dumps({"ts": ts, "event": event, "id": proposal_id}) + "\n"
+    ).encode()
+
+
+class JournalReplayTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "proposals.journal")
+
+    def write(self, *chunks):
+        with open(self.path, "wb") as f:
+            f.write(b"".join(chunks))
+
+    def test_replay_leaves_unfinished_transitions_pending(self):
+        self.write(
+            line("created", "a"),
+            line("vetoed", "a", ts=2.0),
+            line("passed", "b", ts=3.0),
+            line("finalised", "b", ts=4.0),
+        )
+        state = Journal(self.path).replay()
+
+        self.assertEqual(list(state.pending), ["a"])
+        self.assertEqual(state.last_alive, 4.0)
+        self.assertEqual(state.offset, os.path.getsize(self.path))
+
+    def test_torn_tail_is_cut_off(self):
+        complete = line("vetoed", "a")
+        self.write(complete, b'{"ts": 2.0, "event": "fina')
+        state = Journal(self.path).replay()
+
+        self.assertEqual(list(state.pending), ["a"])
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), complete)
+
+    def test_bad_line_mid_file_is_skipped(self):
+        self.write(
+            line("vetoed", "a"),
+            b"not json\n",
+            line("finalised", "a", ts=2.0),
+            line("passed", "b", ts=3.0),
+        )
+        with self.assertLogs("discord", "WARNING"):
+            state = Journal(self.path).replay()
+
+        self.assertEqual(list(state.pending), ["b"])
+        self.assertEqual(state.offset, os.path.getsize(self.path))
+
+    def test_checkpoint_offset_skips_replayed_records(self):
+        first = Journal(self.path)
+        self.write(line("vetoed", "a"))
+        first.replay()
+        first._checkpoint()
+        with open(self.path, "ab") as f:
+            f.write(line("finalised", "a", ts=2.0))
+
+        state = Journal(self.path).replay()
+        self.assertEqual(state.pending, {})
+        self.assertEqual(state.offset, os.path.getsize(self.path))
+
+
+class JournalRotationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "proposals.journal")
+        self.journal = Journal(self.path)
+        self.addCleanup(self.journal._executor.shutdown)
+
+    def test_large_journal_starts_a_fresh_file(self):
+        self.journal._write(
+            [{"ts": 1.0, "event": "vetoed", "id": "a"}]
+            + [{"ts": 2.0, "event": "heartbeat", "id": None}] * 10
+        )
+        with mock.patch.object(journal, "ROTATE_BYTES", 100):
+            self.journal._checkpoint()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+        # The checkpoint carries what the rotated records implied
+        self.journal._write([{"ts": 3.0, "event": "heartbeat", "id": None}])
+        self.journal._file.close()
+        state = Journal(self.path).replay()
+        self.assertEqual(list(state.pending), ["a"])
+        self.assertEqual(state.last_alive, 3.0)
+
+    def test_small_journal_is_kept(self):
+        self.journal._write([{"ts": 1.0, "event": "vetoed", "id": "a"}])
+        self.journal._checkpoint()
+        self.journal._file.close()
+
+        self.assertGreater(os.path.getsize(self.path), 0)
+        state = Journal(self.path).replay()
+        self.assertEqual(list(state.pending), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
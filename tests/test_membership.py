@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("SERVER_ID", "1")
+os.environ.setdefault(
+    "JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "proposals.journal")
+)
+
+import index  # noqa: E402
+from membership import MembershipCache  # noqa: E402
+
+GUILD_ID = 42
+
+
+class MembershipCacheTest(unittest.TestCase):
+    def test_expired_entries_are_swept_first(self):
+        cache = MembershipCache(ttl=10, negative_ttl=1, max_entries=4)
+        with mock.patch("membership.time.monotonic", return_value=0):
+            cache.set_member(GUILD_ID, 1)
+            for user_id in (2, 3, 4):
+                cache.set_non_member(GUILD_ID, user_id)
+        with mock.patch("membership.time.monotonic", return_value=5):
+            cache.set_member(GUILD_ID, 5)
+            self.assertEqual(len(cache), 2)
+            self.assertTrue(cache.get(GUILD_ID, 1))
+            self.assertTrue(cache.get(GUILD_ID, 5))
+
+    def test_oldest_entries_go_when_nothing_expired(self):
+        cache = MembershipCache(max_entries=4)
+        for user_id in range(5):
+            cache.set_member(GUILD_ID, user_id)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(GUILD_ID, 0))
+        self.assertTrue(cache.get(GUILD_ID, 4))
+
+    def test_rewriting_an_entry_makes_it_newest(self):
+        cache = MembershipCache(max_entries=4)
+        for user_id in range(4):
+            cache.set_member(GUILD_ID, user_id)
+        cache.set_member(GUILD_ID, 0)
+        cache.set_member(GUILD_ID, 4)
+        self.assertTrue(cache.get(GUILD_ID, 0))
+        self.assertIsNone(cache.get(GUILD_ID, 1))
+
+
+class MembersOfTest(unittest.IsolatedAsyncioTestCase):
+    async def test_unchunked_lookups_are_bounded(self):
+        in_flight = 0
+        peak = 0
+
+        async def is_member(client, guild_id, user_id):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return user_id % 2 == 0
+
+        lookup = mock.patch.object(index.membership, "is_member", is_member)
+        with mock.patch.object(index.bot, "get_guild", return_value=None):
+            with lookup:
+                members = await index.members_of(GUILD_ID, range(100))
+
+        self.assertEqual(members, list(range(0, 100, 2)))
+        self.assertEqual(peak, index.MEMBER_LOOKUP_CONCURRENCY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import discord
+
+from messages import MessageEditor
+
+
+def not_found():
+    return discord.NotFound(mock.Mock(status=404, reason="Not Found"), "gone")
+
+
+class FakeChannel:
+    def __init__(self):
+        self.edits = []
+        self.sent = []
+        self.gone = set()
+        self.release = None
+
+    def get_partial_message(self, message_id):
+        message = mock.Mock()
+
+        async def edit(**fields):
+            if self.release is not None:
+                await self.release.wait()
+            if message_id in self.gone:
+                raise not_found()
+            self.edits.append((message_id, fields))
+
+        message.edit = edit
+        return message
+
+    async def send(self, **fields):
+        self.sent.append(fields)
+        return mock.Mock(id=1000 + len(self.sent))
+
+
+class MessageEditorTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.editor = MessageEditor()
+
+    async def test_edits_in_the_same_tick_coalesce(self):
+        results = await asyncio.gather(
+            self.editor.edit(self.channel, 1, content="first"),
+            self.editor.edit(self.channel, 1, content="second"),
+        )
+
+        self.assertEqual(results, [1, 1])
+        self.assertEqual(self.channel.edits, [(1, {"content": "second"})])
+        self.assertEqual(self.editor.edits, 1)
+        self.assertEqual(self.editor.coalesced, 1)
+
+    async def test_edits_behind_one_in_flight_coalesce(self):
+        self.channel.release = asyncio.Event()
+        first = asyncio.create_task(
+            self.editor.edit(self.channel, 1, content="first")
+        )
+        await asyncio.sleep(0)
+        later = [
+            asyncio.create_task(
+                self.editor.edit(self.channel, 1, content=content)
+            )
+            for content in ("second", "third")
+        ]
+        await asyncio.sleep(0)
+        self.channel.release.set()
+        await asyncio.gather(first, *later)
+
+        self.assertEqual(
+            self.channel.edits,
+            [(1, {"content": "first"}), (1, {"content": "third"})],
+        )
+
+    async def test_different_messages_are_not_coalesced(self):
+        await asyncio.gather(
+            self.editor.edit(self.channel, 1, content="a"),
+            self.editor.edit(self.channel, 2, content="b"),
+        )
+        self.assertEqual(
+            sorted(self.channel.edits),
+            [(1, {"content": "a"}), (2, {"content": "b"})],
+        )
+
+    async def test_missing_message_is_replaced(self):
+        replaced = mock.AsyncMock()
+        self.editor.on_replaced = replaced
+        self.channel.gone.add(1)
+
+        new_id = await self.editor.edit(self.channel, 1, content="hello")
+
+        self.assertEqual(new_id, 1001)
+        self.assertEqual(self.channel.sent, [{"content": "hello"}])
+        self.assertEqual(self.editor.replaced, 1)
+        replaced.assert_awaited_once()
+        self.assertEqual(replaced.await_args.args[0], 1)
+
+    async def test_errors_reach_every_waiter(self):
+        self.channel.get_partial_message = mock.Mock(
+            side_effect=RuntimeError("boom")
+        )
+        results = await asyncio.gather(
+            self.editor.edit(self.channel, 1, content="a"),
+            self.editor.edit(self.channel, 1, content="b"),
+            return_exceptions=True,
+        )
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from metrics import MetricsRegistry
+
+
+class LabelEscapingTest(unittest.TestCase):
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test")
+        counter.inc(path='C:\\say "hi"\nnow')
+
+        self.assertIn(
+            'test_total{path="C:\\\\say \\"hi\\"\\nnow"} 1', registry.render()
+        )
+
+    def test_plain_values_are_unchanged(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test")
+        counter.inc(handler="veto")
+
+        self.assertIn('test_total{handler="veto"} 1', registry.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
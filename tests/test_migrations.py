@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import (  # noqa: E402
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+)
+
+import migrations  # noqa: E402
+import models  # noqa: E402
+
+SERVER_ID = 977606746317144154
+
+
+def baseline_metadata():
+    # The schema as the first release's models.py created it
+    metadata = MetaData()
+    Table(
+        "proposals",
+        metadata,
+        Column("id", String, primary_key=True),
+        Column("name", String),
+        Column("deadline", Integer),
+        Column("message_id", Integer),
+        Column("created_at", DateTime),
+    )
+    Table(
+        "users",
+        metadata,
+        Column("id", BigInteger, primary_key=True),
+        Column("subscribed_to_all", Boolean),
+    )
+    Table(
+        "user_proposal",
+        metadata,
+        Column("user_id", BigInteger, ForeignKey("users.id")),
+        Column("proposal_id", String, ForeignKey("proposals.id")),
+    )
+    return metadata
+
+
+class MigrateFromBaselineTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.workdir.name, "proposals.db")
+        self.engine = create_engine(f"sqlite:///{path}")
+        baseline_metadata().create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO proposals (id, name, deadline, message_id) "
+                "VALUES ('alice', 'Alice', 100, 42)"
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO users (id, subscribed_to_all) VALUES (7, 1)"
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO user_proposal (user_id, proposal_id) "
+                "VALUES (7, 'alice'), (7, 'alice')"
+            )
+        self._server_id = os.environ.get("SERVER_ID")
+        os.environ["SERVER_ID"] = str(SERVER_ID)
+
+    def tearDown(self):
+        if self._server_id is None:
+            os.environ.pop("SERVER_ID", None)
+        else:
+            os.environ["SERVER_ID"] = self._server_id
+        self.engine.dispose()
+        self.workdir.cleanup()
+
+    def migrate(self):
+        migrations.migrate(self.engine, models.Base.metadata)
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                migrations.get_schema_version(conn), migrations.SCHEMA_VERSION
+            )
+            self.assertEqual(
+                conn.exec_driver_sql(
+                    "SELECT id, guild_id, message_id FROM proposals"
+                ).all(),
+                [(f"{SERVER_ID}:alice", SERVER_ID, 42)],
+            )
+            self.assertEqual(
+                conn.exec_driver_sql(
+                    "SELECT user_id, proposal_id FROM user_proposal"
+                ).all(),
+                [(7, f"{SERVER_ID}:alice")],
+            )
+            self.assertEqual(
+                conn.exec_driver_sql(
+                    "SELECT key, kind, guild_id FROM outbox"
+                ).all(),
+                [(f"{SERVER_ID}:alice:components", "components", SERVER_ID)],
+            )
+
+    def test_baseline(self):
+        self.migrate()
+
+    def test_version_1(self):
+        with self.engine.begin() as conn:
+            migrations.MIGRATIONS[0](conn)
+            migrations.set_schema_version(conn, 1)
+        self.migrate()
+
+    def test_already_current(self):
+        self.migrate()
+        self.migrate()
+
+
+if __name__ == "__main__":
+    unittest.main()
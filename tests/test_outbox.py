@@ -0,0 +1,37 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from outbox import Outbox
+
+
+def row(action_id, kind):
+    return action_id, kind, json.dumps({"guild_id": None}), 0
+
+
+class OutboxPacingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # One token an hour: a second throttled action would wait for it
+        self.outbox = Outbox(repo=None, rate=(1, 3600.0))
+        self.sent = mock.AsyncMock()
+
+    async def test_throttled_kinds_share_the_bucket(self):
+        self.outbox.handler("update")(self.sent)
+        await self.outbox._deliver(row(1, "update"))
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.outbox._deliver(row(2, "update")), 0.1)
+        self.assertEqual(self.sent.await_count, 1)
+
+    async def test_paced_kinds_skip_the_bucket(self):
+        self.outbox.handler("dm", paced=True)(self.sent)
+        for action_id in range(3):
+            result = await asyncio.wait_for(
+                self.outbox._deliver(row(action_id, "dm")), 1
+            )
+            self.assertEqual(result["status"], "delivered")
+        self.assertEqual(self.sent.await_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import time
+import unittest
+
+from scheduler import DeadlineScheduler
+
+
+class DeadlineSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+        self.dispatched = asyncio.Event()
+
+        async def callback(keys):
+            self.batches.append(sorted(keys))
+            self.dispatched.set()
+
+        self.scheduler = DeadlineScheduler(callback)
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    async def next_batch(self, timeout=1):
+        await asyncio.wait_for(self.dispatched.wait(), timeout)
+        self.dispatched.clear()
+        return self.batches[-1]
+
+    async def test_deadlines_due_together_are_one_batch(self):
+        due = time.time() + 0.05
+        for key in ("a", "b", "c"):
+            self.scheduler.schedule(key, due)
+        self.scheduler.schedule("later", due + 60)
+        self.scheduler.start()
+
+        self.assertEqual(await self.next_batch(), ["a", "b", "c"])
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertIn("later", self.scheduler)
+
+    async def test_cancelling_the_earliest_deadline(self):
+        now = time.time()
+        self.scheduler.schedule("first", now + 0.05)
+        self.scheduler.schedule("second", now + 0.1)
+        self.scheduler.start()
+        await asyncio.sleep(0)
+
+        self.assertTrue(self.scheduler.cancel("first"))
+        self.assertFalse(self.scheduler.cancel("first"))
+        self.assertEqual(self.scheduler.next_deadline(), now + 0.1)
+        self.assertEqual(await self.next_batch(), ["second"])
+        self.assertEqual(self.batches, [["second"]])
+
+    async def test_rescheduling_the_earliest_deadline(self):
+        now = time.time()
+        self.scheduler.schedule("a", now + 60)
+        self.scheduler.start()
+        await asyncio.sleep(0)
+
+        # Moving it sooner wakes the sleeping loop
+        self.scheduler.reschedule("a", now + 0.05)
+        self.assertEqual(await self.next_batch(), ["a"])
+
+        self.scheduler.schedule("b", now + 0.1)
+        self.scheduler.reschedule("b", now + 60)
+        self.assertEqual(self.scheduler.deadline("b"), now + 60)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.next_batch(timeout=0.2)
+
+    async def test_stop_dispatches_what_is_already_due(self):
+        self.scheduler.schedule("a", time.time() - 1)
+        self.scheduler.schedule("b", time.time() + 60)
+
+        await self.scheduler.stop()
+        self.assertEqual(self.batches, [["a"]])
+        self.assertIn("b", self.scheduler)
+
+    async def test_tombstones_are_compacted(self):
+        now = time.time() + 60
+        for i in range(200):
+            self.scheduler.schedule(i, now + i)
+        for i in range(150):
+            self.scheduler.cancel(i)
+
+        self.assertEqual(len(self.scheduler), 50)
+        self.assertLess(len(self.scheduler._heap), 200)
+        self.assertEqual(self.scheduler.next_deadline(), now + 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
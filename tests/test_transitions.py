@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+from transitions import TransitionCoordinator
+
+
+class TransitionCoordinatorTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.coordinator = TransitionCoordinator()
+
+    async def test_concurrent_vetoes_join_one_flight(self):
+        release = asyncio.Event()
+        calls = 0
+
+        async def veto():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "vetoed"
+
+        first = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        second = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await asyncio.gather(first, second), ["vetoed"] * 2)
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.coordinator.started, 1)
+        self.assertEqual(self.coordinator.joined, 1)
+        self.assertEqual(self.coordinator.hot(), [("a", 1)])
+
+    async def test_pass_waits_behind_veto(self):
+        release = asyncio.Event()
+        order = []
+        vetoed = False
+
+        async def veto():
+            nonlocal vetoed
+            await release.wait()
+            vetoed = True
+            order.append("veto")
+            return "vetoed"
+
+        async def pass_():
+            order.append("pass")
+            # Re-checked under the lock: the veto already ended the proposal
+            return None if vetoed else "passed"
+
+        veto_task = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        pass_task = asyncio.create_task(
+            self.coordinator.run("a", "pass", pass_)
+        )
+        await asyncio.sleep(0)
+        self.assertEqual(order, [])
+        release.set()
+
+        self.assertEqual(await veto_task, "vetoed")
+        self.assertIsNone(await pass_task)
+        self.assertEqual(order, ["veto", "pass"])
+        self.assertEqual(self.coordinator.waited, 1)
+
+    async def test_failures_reach_every_joiner(self):
+        release = asyncio.Event()
+
+        async def veto():
+            await release.wait()
+            raise RuntimeError("boom")
+
+        first = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        second = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        await asyncio.sleep(0)
+        release.set()
+
+        for result in await asyncio.gather(
+            first, second, return_exceptions=True
+        ):
+            self.assertIsInstance(result, RuntimeError)
+
+    async def test_state_is_released_afterwards(self):
+        async def veto():
+            return "vetoed"
+
+        await self.coordinator.run("a", "veto", veto)
+        self.assertEqual(len(self.coordinator), 0)
+        self.assertEqual(self.coordinator._locks, {})
+
+    async def test_cancelled_joiner_does_not_cancel_the_flight(self):
+        release = asyncio.Event()
+
+        async def veto():
+            await release.wait()
+            return "vetoed"
+
+        first = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        second = asyncio.create_task(self.coordinator.run("a", "veto", veto))
+        await asyncio.sleep(0)
+        second.cancel()
+        release.set()
+
+        self.assertEqual(await first, "vetoed")
+        with self.assertRaises(asyncio.CancelledError):
+            await second
+
+
+if __name__ == "__main__":
+    unittest.main()
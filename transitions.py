@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+
+# Proposals tracked for contention before the coldest half is forgotten
+HOT_LIMIT = 1024
+
+
+class TransitionCoordinator:
+    # One transition per proposal at a time. A caller asking for the
+    # transition already under way joins it and gets the same result instead
+    # of repeating its side effects; a different transition waits its turn.
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+        self.waited = 0
+        self._locks = {}
+        self._flights = {}
+        self._contention = Counter()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def hot(self, n=10):
+        # The proposals most often asked for more than once at a time
+        return self._contention.most_common(n)
+
+    def _contended(self, key):
+        self._contention[key] += 1
+        if len(self._contention) > HOT_LIMIT:
+            self._contention = Counter(
+                dict(self._contention.most_common(HOT_LIMIT // 2))
+            )
+
+    async def run(self, key, transition, func):
+        flight = self._flights.get((key, transition))
+        if flight is not None:
+            self.joined += 1
+            self._contended(key)
+            # Shielded so a joiner giving up does not cancel the transition
+            return await asyncio.shield(flight)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key, transition] = flight
+        self.started += 1
+        # Locks only exist while someone holds or waits for them
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.waited += 1
+                self._contended(key)
+            async with entry[0]:
+                result = await func()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                flight.cancel()
+            else:
+                flight.set_exception(e)
+                # Retrieved here so a transition nobody joined does not warn
+                flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self._flights[key, transition]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
@@ -1,8 +1,19 @@
-from index import create_app, setup_bot
-from waitress import serve
+import os
 
-app = create_app()
-setup_bot()
+PORT = int(os.getenv("PORT", 8080))
 
-if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=8080)
+if os.getenv("RUNTIME") == "asyncio":
+    # One process, one loop: aiohttp serves HTTP next to the bot
+    from index import run_asyncio
+
+    if __name__ == "__main__":
+        run_asyncio(PORT)
+else:
+    from index import create_app, setup_bot
+    from waitress import serve
+
+    app = create_app()
+    setup_bot()
+
+    if __name__ == "__main__":
+        serve(app, host="0.0.0.0", port=PORT)